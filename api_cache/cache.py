@@ -0,0 +1,157 @@
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import APICache
+from .normalizer import normalize_address
+
+
+MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now=None):
+        now = now or timezone.now()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self.misses += 1
+                return MISSING
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class GeocodeCache:
+    '''
+    Двухуровневый кэш координат: LRU в памяти процесса поверх таблицы APICache.
+    Адреса сравниваются по нормализованному виду, см. normalize_address.
+    Запись считается устаревшей через `ttl` после `requested_at`.
+    Адреса, которые геокодер не нашёл, хранятся с координатами None
+    и устаревают быстрее — через `negative_ttl`.
+    '''
+    def __init__(self, maxsize, ttl, negative_ttl):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory = LRUCache(maxsize)
+
+    def get_expiry(self, address_coords, requested_at):
+        if address_coords is None:
+            return requested_at + self.negative_ttl
+        return requested_at + self.ttl
+
+    def get_many(self, addresses):
+        now = timezone.now()
+        coordinates = {}
+        missing_addresses = defaultdict(list)
+        for address in addresses:
+            normalized_address = normalize_address(address)
+            address_coords = self.memory.get(normalized_address, now=now)
+            if address_coords is MISSING:
+                missing_addresses[normalized_address].append(address)
+            else:
+                coordinates[address] = address_coords
+
+        if not missing_addresses:
+            return coordinates
+
+        cached_addresses = (
+            APICache.objects
+            .fresh(self.ttl, self.negative_ttl)
+            .filter(normalized_address__in=missing_addresses.keys())
+        )
+        for cached_address in cached_addresses:
+            address_coords = cached_address.coordinates
+            for address in missing_addresses[cached_address.normalized_address]:
+                coordinates[address] = address_coords
+            self.memory.set(
+                cached_address.normalized_address,
+                address_coords,
+                self.get_expiry(address_coords, cached_address.requested_at),
+            )
+        return coordinates
+
+    def set_many(self, coordinates):
+        if not coordinates:
+            return
+
+        requested_at = timezone.now()
+        normalized_coordinates = {}
+        raw_addresses = {}
+        for address, address_coords in coordinates.items():
+            normalized_address = normalize_address(address)
+            normalized_coordinates[normalized_address] = address_coords
+            raw_addresses.setdefault(normalized_address, address)
+
+        APICache.objects.bulk_create(
+            [
+                APICache(
+                    address=raw_addresses[normalized_address],
+                    normalized_address=normalized_address,
+                    latitude=address_coords and address_coords[0],
+                    longitude=address_coords and address_coords[1],
+                    requested_at=requested_at,
+                )
+                for normalized_address, address_coords in normalized_coordinates.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['normalized_address'],
+            update_fields=['latitude', 'longitude', 'requested_at'],
+        )
+
+        for normalized_address, address_coords in normalized_coordinates.items():
+            self.memory.set(
+                normalized_address,
+                address_coords,
+                self.get_expiry(address_coords, requested_at),
+            )
+
+    def stats(self):
+        return self.memory.stats()
+
+
+geocode_cache = GeocodeCache(
+    maxsize=settings.GEOCODER_CACHE_SIZE,
+    ttl=timedelta(seconds=settings.GEOCODER_CACHE_TTL),
+    negative_ttl=timedelta(seconds=settings.GEOCODER_NEGATIVE_CACHE_TTL),
+)
@@ -0,0 +1,87 @@
+# Generated by Django 4.2.1 on 2026-10-17 21:30
+
+import re
+
+from django.db import migrations, models
+
+
+# копия api_cache.normalizer на момент миграции: ключи, посчитанные здесь,
+# не должны зависеть от будущих правок нормализатора
+ADDRESS_TOKEN_PATTERN = re.compile(r'[\w/]+(?:-[\w/]+)*')
+
+ABBREVIATIONS = {
+    'г': 'город',
+    'гор': 'город',
+    'обл': 'область',
+    'р-н': 'район',
+    'мкр': 'микрорайон',
+    'мкрн': 'микрорайон',
+    'ул': 'улица',
+    'пр': 'проспект',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пр-кт': 'проспект',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'наб': 'набережная',
+    'ш': 'шоссе',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'туп': 'тупик',
+    'д': 'дом',
+    'корп': 'корпус',
+    'к': 'корпус',
+    'стр': 'строение',
+    'кв': 'квартира',
+}
+
+# слова, которые не меняют смысл адреса и чаще всего просто опускаются
+OMITTED_WORDS = {'город', 'дом'}
+
+
+def normalize_address(address):
+    address = address.casefold().replace('ё', 'е')
+    tokens = (
+        ABBREVIATIONS.get(token, token)
+        for token in ADDRESS_TOKEN_PATTERN.findall(address)
+    )
+    return ' '.join(token for token in tokens if token not in OMITTED_WORDS)
+
+
+def fill_normalized_address(apps, schema_editor):
+    APICache = apps.get_model("api_cache", "APICache")
+    seen_addresses = set()
+    dropped_ids = []
+    cached_addresses = APICache.objects.order_by('-requested_at', '-id')
+    for cached_address in cached_addresses.iterator():
+        normalized_address = normalize_address(cached_address.address)
+        # дубли и не влезающие в колонку ключи просто выбрасываем:
+        # это кэш, адрес заново запросят у геокодера
+        if normalized_address in seen_addresses or len(normalized_address) > 200:
+            dropped_ids.append(cached_address.id)
+            continue
+        seen_addresses.add(normalized_address)
+        cached_address.normalized_address = normalized_address
+        cached_address.save(update_fields=['normalized_address'])
+    APICache.objects.filter(id__in=dropped_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_cache', '0002_rename_api_cache_apicache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apicache',
+            name='normalized_address',
+            field=models.CharField(max_length=200, null=True, verbose_name='Нормализованный адрес'),
+        ),
+        migrations.RunPython(fill_normalized_address, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='apicache',
+            name='normalized_address',
+            field=models.CharField(max_length=200, unique=True, verbose_name='Нормализованный адрес'),
+        ),
+    ]
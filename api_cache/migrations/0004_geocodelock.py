@@ -0,0 +1,27 @@
+# Generated by Django 4.2.1 on 2026-10-17 21:50
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_cache', '0003_apicache_normalized_address'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('normalized_address', models.CharField(max_length=200, unique=True, verbose_name='Нормализованный адрес')),
+                ('owner', models.CharField(max_length=32, verbose_name='Владелец')),
+                ('acquired_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Захвачена')),
+            ],
+            options={
+                'verbose_name': 'Блокировка геокодирования',
+                'verbose_name_plural': 'Блокировки геокодирования',
+            },
+        ),
+    ]
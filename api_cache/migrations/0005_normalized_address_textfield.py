@@ -0,0 +1,23 @@
+# Generated by Django 4.2.1 on 2026-10-17 23:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_cache', '0004_geocodelock'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='apicache',
+            name='normalized_address',
+            field=models.TextField(unique=True, verbose_name='Нормализованный адрес'),
+        ),
+        migrations.AlterField(
+            model_name='geocodelock',
+            name='normalized_address',
+            field=models.TextField(unique=True, verbose_name='Нормализованный адрес'),
+        ),
+    ]
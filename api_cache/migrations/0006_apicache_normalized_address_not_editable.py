@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-17 21:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api_cache', '0005_normalized_address_textfield'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='apicache',
+            name='normalized_address',
+            field=models.TextField(editable=False, unique=True, verbose_name='Нормализованный адрес'),
+        ),
+    ]
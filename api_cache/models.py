@@ -1,15 +1,28 @@
 from datetime import datetime
 
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils import timezone
 
 from foodcartapp.validators import lat_validators, lng_validators
+from .normalizer import normalize_address
 '''
 Хранит адрес места и координаты места на карте
 Хранит дату запроса к геокодеру, чтобы знать когда пора обновить данные
 unique
 '''
 
+class APICacheQuerySet(models.QuerySet):
+    def fresh(self, ttl, negative_ttl=None):
+        now = timezone.now()
+        if negative_ttl is None:
+            return self.filter(requested_at__gte=now - ttl)
+        return self.filter(
+            models.Q(latitude__isnull=False, requested_at__gte=now - ttl)
+            | models.Q(latitude__isnull=True, requested_at__gte=now - negative_ttl)
+        )
+
+
 class APICache(models.Model):
     id = models.AutoField(
         verbose_name='Номер запроса к API',
@@ -21,6 +34,13 @@ class APICache(models.Model):
         max_length=200,
         db_index=True
     )
+    # сокращения раскрываются («к» → «корпус»), поэтому ключ бывает
+    # в несколько раз длиннее исходного адреса
+    normalized_address = models.TextField(
+        verbose_name='Нормализованный адрес',
+        unique=True,
+        editable=False,
+    )
     latitude = models.FloatField(
         validators=lat_validators,
         verbose_name='Широта',
@@ -38,9 +58,91 @@ class APICache(models.Model):
         db_index=True
     )
 
+    objects = APICacheQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Кэшированный адрес'
         verbose_name_plural = 'Кэшированные адреса'
 
+    def clean(self):
+        # ключ не редактируется в форме, поэтому его уникальность
+        # форма сама не проверит
+        normalized_address = normalize_address(self.address)
+        duplicates = (
+            APICache.objects
+            .filter(normalized_address=normalized_address)
+            .exclude(id=self.id)
+        )
+        if duplicates.exists():
+            raise ValidationError({'address': 'Этот адрес уже есть в кэше'})
+
+    def save(self, *args, **kwargs):
+        # ключ пересчитываем всегда: при смене адреса старый ключ
+        # отдавал бы координаты прежнего адреса
+        self.normalized_address = normalize_address(self.address)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'address' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'normalized_address'}
+        super().save(*args, **kwargs)
+
+    @property
+    def coordinates(self):
+        if self.latitude is None or self.longitude is None:
+            return None
+        return self.latitude, self.longitude
+
     def __str__(self):
         return f'Адрес: {self.address} // Запрошен: {self.requested_at}'
+
+
+class GeocodeLockQuerySet(models.QuerySet):
+    def acquire(self, normalized_addresses, owner, ttl):
+        '''
+        Захватывает свободные адреса и возвращает те, что достались owner.
+        Блокировки старше ttl считаются брошенными и перехватываются.
+        '''
+        self.filter(
+            normalized_address__in=normalized_addresses,
+            acquired_at__lt=timezone.now() - ttl,
+        ).delete()
+        self.bulk_create(
+            [
+                GeocodeLock(normalized_address=normalized_address, owner=owner)
+                for normalized_address in normalized_addresses
+            ],
+            ignore_conflicts=True,
+        )
+        return set(
+            self.filter(normalized_address__in=normalized_addresses, owner=owner)
+            .values_list('normalized_address', flat=True)
+        )
+
+    def release(self, normalized_addresses, owner):
+        return self.filter(
+            normalized_address__in=normalized_addresses,
+            owner=owner,
+        ).delete()
+
+
+class GeocodeLock(models.Model):
+    normalized_address = models.TextField(
+        verbose_name='Нормализованный адрес',
+        unique=True,
+    )
+    owner = models.CharField(
+        verbose_name='Владелец',
+        max_length=32,
+    )
+    acquired_at = models.DateTimeField(
+        verbose_name='Захвачена',
+        default=timezone.now,
+    )
+
+    objects = GeocodeLockQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Блокировка геокодирования'
+        verbose_name_plural = 'Блокировки геокодирования'
+
+    def __str__(self):
+        return f'{self.normalized_address} // {self.owner}'
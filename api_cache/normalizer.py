@@ -0,0 +1,47 @@
+import re
+
+
+'''
+Приводит адрес к каноническому виду, чтобы «Москва, Тверская 1»
+и «москва,  тверская, д. 1» попадали в одну запись кэша
+'''
+
+ADDRESS_TOKEN_PATTERN = re.compile(r'[\w/]+(?:-[\w/]+)*')
+
+ABBREVIATIONS = {
+    'г': 'город',
+    'гор': 'город',
+    'обл': 'область',
+    'р-н': 'район',
+    'мкр': 'микрорайон',
+    'мкрн': 'микрорайон',
+    'ул': 'улица',
+    'пр': 'проспект',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пр-кт': 'проспект',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'наб': 'набережная',
+    'ш': 'шоссе',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'туп': 'тупик',
+    'д': 'дом',
+    'корп': 'корпус',
+    'к': 'корпус',
+    'стр': 'строение',
+    'кв': 'квартира',
+}
+
+# слова, которые не меняют смысл адреса и чаще всего просто опускаются
+OMITTED_WORDS = {'город', 'дом'}
+
+
+def normalize_address(address):
+    address = address.casefold().replace('ё', 'е')
+    tokens = (
+        ABBREVIATIONS.get(token, token)
+        for token in ADDRESS_TOKEN_PATTERN.findall(address)
+    )
+    return ' '.join(token for token in tokens if token not in OMITTED_WORDS)
@@ -0,0 +1,51 @@
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    '''
+    Следит, чтобы один и тот же ключ вычислялся в процессе только один раз.
+    Поток, первым заявивший ключ, становится ведущим и обязан вызвать
+    resolve. Остальные получают Future и ждут его результата.
+    '''
+    def __init__(self):
+        self.coalesced = 0
+        self.coalesced_remote = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def claim(self, keys):
+        leading_keys = []
+        followed_flights = {}
+        with self._lock:
+            for key in keys:
+                if key in self._flights:
+                    followed_flights[key] = self._flights[key]
+                    self.coalesced += 1
+                else:
+                    self._flights[key] = Future()
+                    leading_keys.append(key)
+        return leading_keys, followed_flights
+
+    def resolve(self, results):
+        with self._lock:
+            flights = {
+                key: self._flights.pop(key)
+                for key in results
+                if key in self._flights
+            }
+        for key, flight in flights.items():
+            flight.set_result(results[key])
+
+    def count_remote(self, count):
+        '''Учитывает ключи, которые вычисляет другой процесс'''
+        with self._lock:
+            self.coalesced_remote += count
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': len(self._flights),
+                'coalesced': self.coalesced,
+                'coalesced_remote': self.coalesced_remote,
+            }
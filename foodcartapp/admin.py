@@ -10,6 +10,7 @@ from .models import Product
 from .models import ProductCategory
 from .models import Restaurant
 from .models import RestaurantMenuItem
+from .menu import set_menu_availability
 from api_cache.models import APICache
 
 
@@ -35,6 +36,42 @@ class RestaurantAdmin(admin.ModelAdmin):
     ]
 
 
+@admin.register(RestaurantMenuItem)
+class RestaurantMenuItemAdmin(admin.ModelAdmin):
+    list_display = [
+        'restaurant',
+        'product',
+        'availability',
+    ]
+    list_filter = [
+        'restaurant',
+        'availability',
+        'product__category',
+    ]
+    search_fields = [
+        'restaurant__name',
+        'product__name',
+    ]
+    list_select_related = [
+        'restaurant',
+        'product',
+    ]
+    actions = [
+        'make_available',
+        'make_unavailable',
+    ]
+
+    @admin.action(description='Вернуть в продажу')
+    def make_available(self, request, queryset):
+        updated_count = set_menu_availability(queryset, True)
+        self.message_user(request, f'Возвращено в продажу: {updated_count}')
+
+    @admin.action(description='Снять с продажи')
+    def make_unavailable(self, request, queryset):
+        updated_count = set_menu_availability(queryset, False)
+        self.message_user(request, f'Снято с продажи: {updated_count}')
+
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
     list_display = [
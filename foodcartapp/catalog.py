@@ -0,0 +1,100 @@
+from hashlib import sha256
+from uuid import uuid4
+
+from django.core.cache import cache
+
+from .models import Product
+from .responses import COMPRESSION_MIN_SIZE, compress, dump_json
+
+
+CATALOG_VERSION_KEY = 'catalog_version'
+CATALOG_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def get_catalog_version():
+    return cache.get_or_set(CATALOG_VERSION_KEY, uuid4().hex, timeout=None)
+
+
+def bump_catalog_version():
+    cache.set(CATALOG_VERSION_KEY, uuid4().hex, timeout=None)
+
+
+PRODUCT_FIELDS = {
+    'id': ['id'],
+    'name': ['name'],
+    'price': ['price'],
+    'special_status': ['special_status'],
+    'description': ['description'],
+    'category': ['category_id', 'category__name'],
+    'image': ['image'],
+    'restaurant': ['id', 'name'],
+}
+
+
+def dump_product(product, fields):
+    dumped_product = {}
+    for field in fields:
+        if field == 'category':
+            dumped_product['category'] = {
+                'id': product['category_id'],
+                'name': product['category__name'],
+            } if product['category_id'] else None
+        elif field == 'image':
+            dumped_product['image'] = Product.image.field.storage.url(product['image'])
+        elif field == 'restaurant':
+            dumped_product['restaurant'] = {
+                'id': product['id'],
+                'name': product['name'],
+            }
+        else:
+            dumped_product[field] = product[field]
+    return dumped_product
+
+
+def fetch_products(fields=PRODUCT_FIELDS, category_id=None, after_id=None,
+                   limit=None):
+    columns = list(dict.fromkeys(
+        column for field in fields for column in PRODUCT_FIELDS[field]
+    ))
+    products = Product.objects.available().order_by('id')
+    if category_id is not None:
+        products = products.filter(category_id=category_id)
+    if after_id is not None:
+        products = products.filter(id__gt=after_id)
+    products = products.values(*columns)
+    if limit is not None:
+        products = products[:limit]
+    return [dump_product(product, fields) for product in products]
+
+
+def get_catalog(pretty=False, encoding=None):
+    '''
+    Возвращает каталог в виде готового JSON, его ETag и способ сжатия.
+    Каждый вариант каталога собирается один раз на каждую версию и дальше
+    отдаётся из кэша без запросов к БД.
+    '''
+    catalog_key = ':'.join([
+        'catalog',
+        get_catalog_version(),
+        'pretty' if pretty else 'compact',
+        encoding or 'identity',
+    ])
+    catalog = cache.get(catalog_key)
+    if catalog is not None:
+        return catalog
+
+    if encoding:
+        uncompressed_catalog = get_catalog(pretty=pretty)
+        if len(uncompressed_catalog['content']) < COMPRESSION_MIN_SIZE:
+            return uncompressed_catalog
+        content = compress(uncompressed_catalog['content'], encoding)
+    else:
+        content = dump_json(fetch_products(), pretty=pretty)
+
+    catalog = {
+        'content': content,
+        'etag': sha256(content).hexdigest(),
+        'encoding': encoding,
+    }
+    cache.set(catalog_key, catalog, timeout=CATALOG_CACHE_TIMEOUT)
+    return catalog
@@ -0,0 +1,123 @@
+import numpy as np
+
+from geopy.distance import EARTH_RADIUS
+from scipy.spatial import cKDTree
+
+
+def to_unit_vectors(points):
+    points = np.radians(np.asarray(points, dtype=float).reshape(-1, 2))
+    lat, lng = points[:, 0], points[:, 1]
+    return np.column_stack([
+        np.cos(lat) * np.cos(lng),
+        np.cos(lat) * np.sin(lng),
+        np.sin(lat),
+    ])
+
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS * np.arcsin(np.clip(np.asarray(chord) / 2, 0, 1))
+
+
+def km_to_chord(distance_km):
+    return 2 * np.sin(min(distance_km / (2 * EARTH_RADIUS), np.pi / 2))
+
+
+class RestaurantIndex:
+    '''
+    k-d дерево по координатам ресторанов. Точки хранятся как единичные
+    векторы на сфере: длина хорды монотонна по расстоянию по дуге, поэтому
+    ближайшие по хорде рестораны — ближайшие и по поверхности Земли.
+    Радиус Земли тот же, что у geopy.distance.great_circle, поэтому
+    расстояния совпадают с ним с точностью до 1e-6 км.
+    '''
+    def __init__(self, restaurants):
+        self.restaurants = [
+            restaurant for restaurant in restaurants
+            if all([restaurant.latitude, restaurant.longitude])
+        ]
+        self.tree = None
+        if self.restaurants:
+            self.tree = cKDTree(to_unit_vectors([
+                (restaurant.latitude, restaurant.longitude)
+                for restaurant in self.restaurants
+            ]))
+
+    def __len__(self):
+        return len(self.restaurants)
+
+    def nearest(self, points, available_restaurant_ids, limit=None):
+        '''
+        Для каждой точки возвращает не более limit ближайших ресторанов
+        из соответствующего множества available_restaurant_ids в виде
+        списка пар (ресторан, расстояние в км).
+        '''
+        found = [[] for _ in points]
+        if not self.restaurants or not len(points):
+            return found
+
+        restaurants_count = len(self.restaurants)
+        limit = min(limit or restaurants_count, restaurants_count)
+        vectors = to_unit_vectors(points)
+
+        pending = list(range(len(points)))
+        neighbours_count = limit
+        while pending:
+            neighbours_count = min(neighbours_count, restaurants_count)
+            chords, positions = self.tree.query(
+                vectors[pending],
+                k=list(range(1, neighbours_count + 1)),
+            )
+
+            still_pending = []
+            for point, point_chords, point_positions in zip(
+                pending, chords, positions
+            ):
+                nearest_restaurants = [
+                    (self.restaurants[position], chord)
+                    for chord, position in zip(point_chords, point_positions)
+                    if self.restaurants[position].id
+                    in available_restaurant_ids[point]
+                ][:limit]
+                if (len(nearest_restaurants) < limit
+                        and neighbours_count < restaurants_count):
+                    still_pending.append(point)
+                    continue
+                found[point] = [
+                    (restaurant, float(chord_to_km(chord)))
+                    for restaurant, chord in nearest_restaurants
+                ]
+
+            pending = still_pending
+            neighbours_count *= 4
+
+        return found
+
+    def within(self, points, available_restaurant_ids, radius_km):
+        '''
+        Для каждой точки возвращает рестораны из available_restaurant_ids
+        не дальше radius_km, упорядоченные по расстоянию.
+        '''
+        found = [[] for _ in points]
+        if not self.restaurants or not len(points):
+            return found
+
+        vectors = to_unit_vectors(points)
+        positions = self.tree.query_ball_point(vectors, r=km_to_chord(radius_km))
+        for point, (vector, point_positions) in enumerate(zip(vectors, positions)):
+            point_positions = [
+                position for position in point_positions
+                if self.restaurants[position].id
+                in available_restaurant_ids[point]
+            ]
+            distances_km = chord_to_km(np.linalg.norm(
+                self.tree.data[point_positions] - vector,
+                axis=1,
+            ))
+            found[point] = sorted(
+                (
+                    (self.restaurants[position], float(distance_km))
+                    for position, distance_km in zip(point_positions, distances_km)
+                ),
+                key=lambda x: x[1],
+            )
+        return found
@@ -0,0 +1,192 @@
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+# пауза между повторами в секундах, сколько бы ни вырос backoff
+GEOCODER_BACKOFF_MAX = 2
+
+geocoder = None
+geocoder_lock = threading.Lock()
+
+
+class GeocoderError(Exception):
+    pass
+
+
+class CircuitOpenError(GeocoderError):
+    pass
+
+
+class CircuitBreaker:
+    '''
+    После failure_threshold сбоев подряд перестаёт пропускать вызовы на
+    reset_timeout секунд. Затем пропускает один пробный вызов: если он
+    удался, работа возобновляется, если нет — пауза начинается заново.
+    '''
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.calls = 0
+        self.failures = 0
+        self.short_circuited = 0
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    def _allow_call(self):
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    self.short_circuited += 1
+                    return False
+                self.state = 'half-open'
+            elif self.state == 'half-open':
+                # пробный вызов уже выполняется в другом потоке
+                self.short_circuited += 1
+                return False
+            self.calls += 1
+            return True
+
+    def _record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.consecutive_failures = 0
+
+    def _record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if (self.state == 'half-open'
+                    or self.consecutive_failures >= self.failure_threshold):
+                if self.state != 'open':
+                    self.times_opened += 1
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def call(self, func, *args, **kwargs):
+        if not self._allow_call():
+            raise CircuitOpenError('Геокодер временно недоступен')
+        try:
+            result = func(*args, **kwargs)
+        except GeocoderError:
+            self._record_failure()
+            raise
+        except Exception as error:
+            # любой сбой должен завершить пробный вызов, иначе
+            # предохранитель навсегда останется полуоткрытым
+            self._record_failure()
+            raise GeocoderError('Геокодер вернул неожиданную ошибку') from error
+        else:
+            self._record_success()
+            return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'calls': self.calls,
+                'failures': self.failures,
+                'short_circuited': self.short_circuited,
+                'times_opened': self.times_opened,
+            }
+
+
+geocoder_breaker = CircuitBreaker(
+    failure_threshold=settings.GEOCODER_BREAKER_THRESHOLD,
+    reset_timeout=settings.GEOCODER_BREAKER_RESET_TIMEOUT,
+)
+
+
+class CappedRetry(Retry):
+    # backoff_max есть в конструкторе только у urllib3 2.x,
+    # поэтому паузу ограничиваем так, чтобы работало и на 1.26
+    def get_backoff_time(self):
+        return min(super().get_backoff_time(), GEOCODER_BACKOFF_MAX)
+
+
+class YandexGeocoder:
+    '''
+    Клиент геокодера Яндекса. Держит одну requests.Session на процесс:
+    соединения переиспользуются между запросами и потоками, а запросы,
+    упавшие на сетевой ошибке или 429/5xx, повторяются с нарастающей паузой.
+
+    Retry-After не учитываем: на 429 геокодер может попросить подождать
+    минуты, а поток заказа столько ждать не должен. Худший случай — все
+    попытки упёрлись в таймауты: (retries + 1) × (connect_timeout + timeout)
+    плюс паузы между повторами, каждая не дольше GEOCODER_BACKOFF_MAX.
+    С настройками по умолчанию это 3 × (3 + 5) + 1 = 25 секунд.
+    '''
+    def __init__(self, base_url, api_key, timeout, connect_timeout,
+                 retries, backoff_factor, pool_size):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = (connect_timeout, timeout)
+        retry = CappedRetry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=('GET',),
+            respect_retry_after_header=False,
+        )
+        adapter = HTTPAdapter(
+            max_retries=retry,
+            pool_connections=1,
+            pool_maxsize=pool_size,
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def geocode(self, address):
+        try:
+            response = self.session.get(self.base_url, params={
+                "geocode": address,
+                "apikey": self.api_key,
+                "format": "json",
+            }, timeout=self.timeout)
+            response.raise_for_status()
+            found_places = response.json()['response']['GeoObjectCollection']['featureMember']
+            if not found_places:
+                return None
+
+            most_relevant = found_places[0]
+            lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
+            return float(lat), float(lon)
+        except requests.RequestException as error:
+            raise GeocoderError(f'Геокодер не ответил на запрос «{address}»') from error
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as error:
+            raise GeocoderError(f'Геокодер вернул непонятный ответ на запрос «{address}»') from error
+
+
+def get_geocoder():
+    global geocoder
+    with geocoder_lock:
+        if geocoder is None:
+            backend = import_string(settings.GEOCODER_BACKEND)
+            geocoder = backend(
+                base_url=settings.GEOCODER_URL,
+                api_key=settings.YANDEX_MAPS_API_KEY,
+                timeout=settings.GEOCODER_TIMEOUT,
+                connect_timeout=settings.GEOCODER_CONNECT_TIMEOUT,
+                retries=settings.GEOCODER_RETRIES,
+                backoff_factor=settings.GEOCODER_BACKOFF_FACTOR,
+                pool_size=settings.GEOCODER_MAX_WORKERS,
+            )
+        return geocoder
+
+
+def fetch_coordinates(address):
+    '''
+    Возвращает координаты адреса или None, если геокодер его не нашёл.
+    При сбое геокодера или разомкнутом предохранителе бросает GeocoderError.
+    '''
+    return geocoder_breaker.call(get_geocoder().geocode, address)
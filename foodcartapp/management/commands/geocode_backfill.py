@@ -0,0 +1,149 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api_cache.models import APICache
+from foodcartapp.models import Order, Restaurant
+from foodcartapp.navigator import (
+    GEOCODER_MAX_WORKERS,
+    fetch_coordinates,
+    fetch_coordinates_batch,
+    invalidate_restaurant_index,
+    refresh_order_candidates,
+)
+
+
+class RateLimiter:
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self.next_call_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def __call__(self, func):
+        def limited(*args, **kwargs):
+            with self.lock:
+                wait_for = self.next_call_at - time.monotonic()
+                self.next_call_at = max(self.next_call_at, time.monotonic()) + self.interval
+            if wait_for > 0:
+                time.sleep(wait_for)
+            return func(*args, **kwargs)
+        return limited
+
+
+class Command(BaseCommand):
+    help = (
+        'Геокодирует рестораны и заказы без координат, а также устаревшие '
+        'адреса в кэше. Результаты сохраняются после каждой пачки, поэтому '
+        'прерванную команду можно просто запустить снова.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько адресов геокодировать и сохранять за один раз',
+        )
+        parser.add_argument(
+            '--rate', type=float, default=10,
+            help='Не больше стольких запросов к геокодеру в секунду',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=GEOCODER_MAX_WORKERS,
+            help='Сколько запросов к геокодеру выполнять параллельно',
+        )
+
+    def handle(self, *args, batch_size, rate, workers, **options):
+        geocoder = RateLimiter(rate)(fetch_coordinates)
+
+        restaurants = (
+            Restaurant.objects
+            .filter(latitude__isnull=True)
+            .exclude(address='')
+            .order_by('id')
+        )
+        orders = Order.objects.filter(latitude__isnull=True).order_by('id')
+        stale_addresses = (
+            APICache.objects
+            .filter(requested_at__lt=timezone.now() - timedelta(
+                seconds=settings.GEOCODER_CACHE_TTL
+            ))
+            .order_by('id')
+            .values_list('address', flat=True)
+        )
+
+        addresses = list(dict.fromkeys([
+            *restaurants.values_list('address', flat=True),
+            *orders.values_list('address', flat=True),
+            *stale_addresses,
+        ]))
+        self.stdout.write(f'Адресов к геокодированию: {len(addresses)}')
+
+        geocoded_count = 0
+        has_new_restaurants = False
+        for batch_start in range(0, len(addresses), batch_size):
+            batch = addresses[batch_start:batch_start + batch_size]
+            coordinates = fetch_coordinates_batch(
+                batch,
+                geocoder=geocoder,
+                max_workers=workers,
+            )
+            geocoded_count += sum(
+                1 for address_coords in coordinates.values() if address_coords
+            )
+
+            geocoded_restaurants = self.save_coordinates(
+                restaurants.filter(address__in=batch),
+                coordinates,
+            )
+            if geocoded_restaurants:
+                # bulk_update не отправляет сигналов, поэтому индекс
+                # ресторанов сбрасываем сами, до пересчёта заказов
+                invalidate_restaurant_index()
+                has_new_restaurants = True
+            geocoded_orders = self.save_coordinates(
+                orders.filter(address__in=batch),
+                coordinates,
+            )
+            refresh_order_candidates(
+                order for order in geocoded_orders if order.status != 'completed'
+            )
+
+            self.stdout.write(
+                f'Обработано {batch_start + len(batch)} из {len(addresses)}, '
+                f'найдено координат: {geocoded_count}'
+            )
+
+        if has_new_restaurants:
+            # у заказов, которые уже были с координатами, кандидаты
+            # посчитаны без только что геокодированных ресторанов
+            self.refresh_open_orders(batch_size)
+
+    def refresh_open_orders(self, batch_size):
+        open_orders = Order.objects.open().order_by('id')
+        refreshed_count = 0
+        last_order_id = 0
+        while True:
+            orders_batch = list(
+                open_orders.filter(id__gt=last_order_id)[:batch_size]
+            )
+            if not orders_batch:
+                break
+            refresh_order_candidates(orders_batch)
+            refreshed_count += len(orders_batch)
+            last_order_id = orders_batch[-1].id
+        self.stdout.write(f'Пересчитаны рестораны для открытых заказов: {refreshed_count}')
+
+    def save_coordinates(self, places, coordinates):
+        geocoded_places = []
+        for place in places:
+            if place_coords := coordinates.get(place.address):
+                place.latitude, place.longitude = place_coords
+                geocoded_places.append(place)
+        places.model.objects.bulk_update(
+            geocoded_places,
+            ['latitude', 'longitude'],
+        )
+        return geocoded_places
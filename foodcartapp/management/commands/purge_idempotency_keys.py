@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from foodcartapp.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = 'Удаляет устаревшие ключи идемпотентности заказов'
+
+    def handle(self, *args, **options):
+        deleted_count, _ = (
+            IdempotencyKey.objects
+            .expired(timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL))
+            .delete()
+        )
+        self.stdout.write(f'Удалено ключей: {deleted_count}')
@@ -0,0 +1,119 @@
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from django.dispatch import Signal
+
+from .models import Restaurant, RestaurantMenuItem
+from .versioned_cache import VersionedProcessCache
+
+
+AVAILABILITY_MATRIX_MAX_AGE = 60
+
+# queryset.update() не отправляет post_save, поэтому массовое изменение
+# наличия сообщает о себе одним сигналом на весь запрос
+menu_availability_changed = Signal()
+
+
+class AvailabilityMatrix:
+    '''
+    Матрица «товар × ресторан». Для каждого товара хранится битовая маска:
+    бит i выставлен, если товар продаётся в i-м ресторане (рестораны
+    упорядочены по названию).
+    '''
+    def __init__(self, restaurant_ids, availability):
+        self.restaurant_ids = restaurant_ids
+        self.availability = availability
+        self.restaurant_positions = {
+            restaurant_id: position
+            for position, restaurant_id in enumerate(restaurant_ids)
+        }
+
+    @classmethod
+    def build(cls):
+        restaurant_ids = list(
+            Restaurant.objects.order_by('name').values_list('id', flat=True)
+        )
+        restaurant_bits = {
+            restaurant_id: 1 << position
+            for position, restaurant_id in enumerate(restaurant_ids)
+        }
+
+        availability = {}
+        menu_items = (
+            RestaurantMenuItem.objects
+            .filter(availability=True)
+            .values_list('product_id', 'restaurant_id')
+        )
+        for product_id, restaurant_id in menu_items:
+            availability[product_id] = (
+                availability.get(product_id, 0) | restaurant_bits[restaurant_id]
+            )
+        return cls(restaurant_ids, availability)
+
+    def get_product_availability(self, product_id, restaurant_ids):
+        '''
+        Флаги наличия товара в ресторанах restaurant_ids, в том же порядке.
+        '''
+        product_availability = self.availability.get(product_id, 0)
+        return [
+            bool(
+                product_availability
+                >> self.restaurant_positions[restaurant_id] & 1
+            )
+            for restaurant_id in restaurant_ids
+        ]
+
+    def get_restaurants_with_products(self, product_ids):
+        if not product_ids:
+            return []
+
+        restaurants = (1 << len(self.restaurant_ids)) - 1
+        for product_id in product_ids:
+            restaurants &= self.availability.get(product_id, 0)
+
+        return [
+            restaurant_id
+            for position, restaurant_id in enumerate(self.restaurant_ids)
+            if restaurants >> position & 1
+        ]
+
+
+availability_matrix_cache = VersionedProcessCache(
+    key='availability_matrix_version',
+    max_age=AVAILABILITY_MATRIX_MAX_AGE,
+    build=AvailabilityMatrix.build,
+)
+
+
+def get_availability_matrix():
+    return availability_matrix_cache.get()
+
+
+def invalidate_availability_matrix():
+    availability_matrix_cache.invalidate()
+
+
+def select_menu_items(restaurant_products):
+    '''
+    Отбирает позиции меню по парам (ресторан, товар), сгруппированным
+    по ресторанам: {restaurant_id: [product_id, ...]}.
+    '''
+    if not restaurant_products:
+        return RestaurantMenuItem.objects.none()
+    return RestaurantMenuItem.objects.filter(reduce(or_, (
+        Q(restaurant_id=restaurant_id, product_id__in=product_ids)
+        for restaurant_id, product_ids in restaurant_products.items()
+    )))
+
+
+def set_menu_availability(menu_items, availability):
+    menu_items = menu_items.exclude(availability=availability)
+    product_ids = set(menu_items.values_list('product_id', flat=True))
+    updated_count = menu_items.update(availability=availability)
+    if updated_count:
+        menu_availability_changed.send(
+            sender=RestaurantMenuItem,
+            product_ids=product_ids,
+        )
+    return updated_count
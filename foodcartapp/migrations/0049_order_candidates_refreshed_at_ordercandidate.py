@@ -0,0 +1,34 @@
+# Generated by Django 4.2.1 on 2026-10-17 20:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0048_order_latitude_order_longitude_order_restaurant_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='candidates_refreshed_at',
+            field=models.DateTimeField(blank=True, db_index=True, default=None, null=True, verbose_name='Кандидаты пересчитаны'),
+        ),
+        migrations.CreateModel(
+            name='OrderCandidate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance_km', models.FloatField(blank=True, null=True, verbose_name='Расстояние, км')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candidates', to='foodcartapp.order', verbose_name='Заказ')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_candidates', to='foodcartapp.restaurant', verbose_name='Ресторан')),
+            ],
+            options={
+                'verbose_name': 'Ресторан-кандидат',
+                'verbose_name_plural': 'Рестораны-кандидаты',
+                'ordering': [models.OrderBy(models.F('distance_km'), nulls_last=True)],
+                'unique_together': {('order', 'restaurant')},
+            },
+        ),
+    ]
@@ -144,10 +144,24 @@ class RestaurantMenuItem(models.Model):
         return f"{self.restaurant.name} - {self.product.name}"
 
 
-class OrderQuerySet(models.Manager):
-    def get_total(self):
-        return super().get_total().annotate(
-            sum=Sum(F('items__item_price') * F('items__quantity'))
+class OrderQuerySet(models.QuerySet):
+    def open(self):
+        return self.exclude(status='completed')
+
+    def with_total(self):
+        return self.annotate(
+            total=Sum(
+                F('items__item_price') * F('items__quantity'),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            )
+        )
+
+    def with_items(self):
+        return self.prefetch_related(
+            models.Prefetch(
+                'items',
+                queryset=OrderItem.objects.select_related('product'),
+            )
         )
 
 
@@ -237,8 +251,20 @@ class Order(models.Model):
         null=True,
         blank=True,
     )
+    candidates_refreshed_at = models.DateTimeField(
+        'Кандидаты пересчитаны',
+        default=None,
+        blank=True,
+        null=True,
+        db_index=True
+    )
+    updated_at = models.DateTimeField(
+        'Изменён',
+        auto_now=True,
+        db_index=True
+    )
 
-    objects = OrderQuerySet()
+    objects = OrderQuerySet.as_manager()
 
     class Meta:
         ordering = ['id']
@@ -279,3 +305,73 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f'{self.order} - {self.product}'
+
+
+class OrderCandidate(models.Model):
+    order = models.ForeignKey(
+        Order,
+        related_name='candidates',
+        verbose_name='Заказ',
+        on_delete=models.CASCADE
+    )
+    restaurant = models.ForeignKey(
+        Restaurant,
+        related_name='order_candidates',
+        verbose_name='Ресторан',
+        on_delete=models.CASCADE
+    )
+    distance_km = models.FloatField(
+        verbose_name='Расстояние, км',
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        ordering = [models.F('distance_km').asc(nulls_last=True)]
+        verbose_name = 'Ресторан-кандидат'
+        verbose_name_plural = 'Рестораны-кандидаты'
+        unique_together = [
+            ['order', 'restaurant']
+        ]
+
+    def __str__(self):
+        return f'{self.order_id} - {self.restaurant}'
+
+
+class IdempotencyKeyQuerySet(models.QuerySet):
+    def expired(self, ttl):
+        return self.filter(created_at__lt=timezone.now() - ttl)
+
+
+class IdempotencyKey(models.Model):
+    key = models.CharField(
+        'Ключ',
+        max_length=255,
+        unique=True,
+    )
+    request_hash = models.CharField(
+        'Хэш запроса',
+        max_length=64,
+    )
+    order = models.ForeignKey(
+        Order,
+        related_name='idempotency_keys',
+        verbose_name='Заказ',
+        on_delete=models.CASCADE
+    )
+    response = models.JSONField(
+        'Ответ',
+    )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        db_index=True
+    )
+
+    objects = IdempotencyKeyQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Ключ идемпотентности'
+        verbose_name_plural = 'Ключи идемпотентности'
+
+    def __str__(self):
+        return f'{self.key} - {self.order_id}'
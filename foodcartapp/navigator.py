@@ -1,114 +1,346 @@
-from datetime import datetime
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from uuid import uuid4
 
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
-
-from geopy.distance import great_circle as RADIUS
+from django.db import transaction
+from django.utils import timezone
 
 import logging
-import requests
 
-from api_cache.models import APICache
+from api_cache.cache import MISSING, geocode_cache
+from api_cache.models import GeocodeLock
+from api_cache.normalizer import normalize_address
+from api_cache.singleflight import SingleFlight
+from .distances import RestaurantIndex
+from .geocoder import GeocoderError, fetch_coordinates
+from .menu import get_availability_matrix
 from .models import (
     Restaurant,
-    Product,
-    RestaurantMenuItem
+    Order,
+    OrderCandidate,
+    OrderItem,
 )
+from .versioned_cache import VersionedProcessCache
+
 
+GEOCODER_MAX_WORKERS = settings.GEOCODER_MAX_WORKERS
+GEOCODER_LOCK_TIMEOUT = timedelta(seconds=settings.GEOCODER_LOCK_TIMEOUT)
+GEOCODER_LOCK_POLL_INTERVAL = 0.1
+ORDER_CANDIDATES_LIMIT = settings.ORDER_CANDIDATES_LIMIT
+RESTAURANT_INDEX_MAX_AGE = 60
 
-YANDEX_MAPS_API_KEY = settings.YANDEX_MAPS_API_KEY
+geocode_flights = SingleFlight()
 
 logging.basicConfig(filename='error.log', level=logging.ERROR)
 
 
-def fetch_coordinates(address, api_key=YANDEX_MAPS_API_KEY):
+def fetch_available_restaurants(order_ids):
+    restaurants = Restaurant.objects.in_bulk()
+    availability_matrix = get_availability_matrix()
+
+    products_in_order = defaultdict(set)
+    order_items = (
+        OrderItem.objects
+        .filter(order_id__in=order_ids)
+        .values_list('order_id', 'product_id')
+    )
+    for order_id, product_id in order_items:
+        products_in_order[order_id].add(product_id)
+
+    available_restaurants = {}
+    for order_id in order_ids:
+        restaurant_ids = availability_matrix.get_restaurants_with_products(
+            products_in_order.get(order_id)
+        )
+        available_restaurants[order_id] = [
+            restaurants[restaurant_id] for restaurant_id in restaurant_ids
+            if restaurant_id in restaurants
+        ]
+    return available_restaurants
+
+
+def geocode_in_parallel(addresses, geocoder, max_workers):
+    def geocode(address):
+        try:
+            return geocoder(address)
+        except GeocoderError:
+            logging.exception('Не удалось геокодировать адрес «%s»', address)
+            return MISSING
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        fetched_coordinates = dict(zip(
+            addresses.keys(),
+            executor.map(geocode, addresses.values()),
+        ))
+    return {
+        normalized_address: address_coords
+        for normalized_address, address_coords in fetched_coordinates.items()
+        if address_coords is not MISSING
+    }
+
+
+def wait_for_coordinates(addresses):
+    deadline = time.monotonic() + GEOCODER_LOCK_TIMEOUT.total_seconds()
+    coordinates = {}
+    while True:
+        pending_addresses = addresses.keys() - coordinates.keys()
+        # блокировку проверяем до кэша: процесс пишет в кэш раньше,
+        # чем отпускает адрес, так что его результат мы не пропустим
+        is_still_locked = GeocodeLock.objects.filter(
+            normalized_address__in=pending_addresses,
+        ).exists()
+        cached_coordinates = geocode_cache.get_many(
+            addresses[normalized_address]
+            for normalized_address in pending_addresses
+        )
+        for normalized_address in pending_addresses:
+            address = addresses[normalized_address]
+            if address in cached_coordinates:
+                coordinates[normalized_address] = cached_coordinates[address]
+
+        if len(coordinates) == len(addresses) or not is_still_locked:
+            return coordinates
+        if time.monotonic() > deadline:
+            return coordinates
+        time.sleep(GEOCODER_LOCK_POLL_INTERVAL)
+
+
+def geocode_exclusively(addresses, geocoder, max_workers):
+    '''
+    Геокодирует адреса, которые не геокодирует прямо сейчас другой процесс.
+    Адреса, захваченные другими процессами, дожидается из кэша.
+    '''
+    if not addresses:
+        return {}
+
+    owner = uuid4().hex
+    owned_addresses = GeocodeLock.objects.acquire(
+        addresses.keys(),
+        owner,
+        GEOCODER_LOCK_TIMEOUT,
+    )
     try:
-        api_url = "https://geocode-maps.yandex.ru/1.x"
-        response = requests.get(api_url, params={
-            "geocode": address,
-            "apikey": api_key,
-            "format": "json",
+        coordinates = geocode_in_parallel(
+            {
+                normalized_address: addresses[normalized_address]
+                for normalized_address in owned_addresses
+            },
+            geocoder,
+            max_workers,
+        )
+        geocode_cache.set_many({
+            addresses[normalized_address]: address_coords
+            for normalized_address, address_coords in coordinates.items()
+        })
+    finally:
+        GeocodeLock.objects.release(owned_addresses, owner)
+
+    locked_addresses = {
+        normalized_address: address
+        for normalized_address, address in addresses.items()
+        if normalized_address not in owned_addresses
+    }
+    if locked_addresses:
+        geocode_flights.count_remote(len(locked_addresses))
+        coordinates.update(wait_for_coordinates(locked_addresses))
+    return coordinates
+
+
+def fetch_coordinates_batch(addresses, geocoder=fetch_coordinates,
+                            max_workers=GEOCODER_MAX_WORKERS):
+    '''
+    Возвращает словарь {адрес: координаты или None, если адрес не найден}.
+    Адреса, которые не удалось геокодировать из-за сбоя, в него не попадают.
+    '''
+    addresses = set(filter(None, addresses))
+
+    coordinates = geocode_cache.get_many(addresses)
+
+    # разные написания одного адреса геокодируем одним запросом
+    spellings = defaultdict(list)
+    for address in addresses - coordinates.keys():
+        spellings[normalize_address(address)].append(address)
+
+    # адреса, которые уже геокодирует другой поток, ждём, а не запрашиваем
+    leading_addresses, followed_flights = geocode_flights.claim(spellings)
+    fetched_coordinates = {}
+    try:
+        fetched_coordinates = geocode_exclusively(
+            {
+                normalized_address: spellings[normalized_address][0]
+                for normalized_address in leading_addresses
+            },
+            geocoder,
+            max_workers,
+        )
+    finally:
+        geocode_flights.resolve({
+            normalized_address: fetched_coordinates.get(normalized_address, MISSING)
+            for normalized_address in leading_addresses
         })
-        response.raise_for_status()
-        found_places = response.json()['response']['GeoObjectCollection']['featureMember']
-
-        if not found_places:
-            return None
-    except:
-        return None
-
-    most_relevant = found_places[0]
-    lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
-    return lat, lon
-
-
-def fetch_available_restaurants(order_id):
-    restaurants = Restaurant.objects.prefetch_related('menu_items').order_by('name')
-    products_in_order = Product.objects.with_items_in_order(order_id).order_by('name').values_list('id', flat=True)
-    menu_items = RestaurantMenuItem.objects.all()
-
-    is_product_in_restaurant = {}
-    for restaurant in restaurants:
-        is_product_in_restaurant[restaurant.id] = [
-                item.availability for item in menu_items.filter(
-                    product__in=products_in_order, restaurant=restaurant,
-                ).order_by('product__name')
-                ]
-
-    restaurants_with_complete_set = [
-        restaurant.id for restaurant in restaurants if all(
-            is_product_in_restaurant[restaurant.id]
+    for normalized_address, flight in followed_flights.items():
+        fetched_coordinates[normalized_address] = flight.result()
+
+    for normalized_address, address_coords in fetched_coordinates.items():
+        if address_coords is MISSING:
+            continue
+        for address in spellings[normalized_address]:
+            coordinates[address] = address_coords
+
+    # None — геокодер ответил, что адреса нет; адресов, на которых
+    # геокодер сломался, в ответе нет вовсе
+    return coordinates
+
+
+def build_restaurant_index():
+    return RestaurantIndex(
+        Restaurant.objects.filter(
+            latitude__isnull=False,
+            longitude__isnull=False,
         )
+    )
+
+
+restaurant_index_cache = VersionedProcessCache(
+    key='restaurant_index_version',
+    max_age=RESTAURANT_INDEX_MAX_AGE,
+    build=build_restaurant_index,
+)
+
+
+def get_restaurant_index():
+    return restaurant_index_cache.get()
+
+
+def invalidate_restaurant_index():
+    restaurant_index_cache.invalidate()
+
+
+def fetch_restaurants_distances(orders, available_restaurants,
+                                geocoder=fetch_coordinates, limit=None):
+    '''
+    Возвращает расстояния от заказов до ресторанов и id заказов, адреса
+    которых не удалось геокодировать из-за сбоя геокодера.
+    '''
+    restaurants = {
+        restaurant.id: restaurant
+        for order in orders
+        for restaurant in available_restaurants[order.id]
+    }
+
+    orders_without_coords = [
+        order for order in orders
+        if not all([order.latitude, order.longitude])
+    ]
+    restaurants_without_coords = [
+        restaurant for restaurant in restaurants.values()
+        if not all([restaurant.latitude, restaurant.longitude])
     ]
-    return restaurants.filter(id__in=restaurants_with_complete_set)
+    coordinates = fetch_coordinates_batch(
+        [order.address for order in orders_without_coords]
+        + [restaurant.address for restaurant in restaurants_without_coords],
+        geocoder=geocoder,
+    )
 
+    for model, places in (
+        (Order, orders_without_coords),
+        (Restaurant, restaurants_without_coords),
+    ):
+        geocoded_places = []
+        for place in places:
+            if place_coords := coordinates.get(place.address):
+                place.latitude, place.longitude = place_coords
+                geocoded_places.append(place)
+        model.objects.bulk_update(geocoded_places, ['latitude', 'longitude'])
 
-def fetch_restaurants_distances(restaurants, order):
-    try:
-        cached_address = APICache.objects.get(address=order.address)
-    except ObjectDoesNotExist:
-        cached_address = None
-
-    if cached_address:
-        order_coords = (cached_address.latitude, cached_address.longitude)
-    else:
-        if not all([order.latitude, order.longitude]):
-            if order_coords := fetch_coordinates(order.address):
-                latitude, longitude = order_coords
-            else:
-                return {}
-            order.latitude = latitude
-            order.longitude = longitude
-            order.save()
-
-            APICache.objects.create(
-                address=order.address,
-                latitude=latitude,
-                longitude=longitude,
-                requested_at=datetime.now()
-            )
-        else:
-            order_coords = (order.latitude, order.longitude)
-
-    restaurants_distances = {}
-    for restaurant in restaurants:
-        if not all([restaurant.latitude, restaurant.longitude]):
-            if restaurant_coordinates := fetch_coordinates(restaurant.address):
-                latitude, longitude = restaurant_coordinates
-                restaurant.latitude = latitude
-                restaurant.longitude = longitude
-                restaurant.save()
-                restaurant_coords = (latitude, longitude)
-            else:
-                continue
-        else:
-            restaurant_coords = (restaurant.latitude, restaurant.longitude)
+    if any(restaurant.latitude for restaurant in restaurants_without_coords):
+        invalidate_restaurant_index()
+
+    distances = {order.id: {} for order in orders}
+    failed_order_ids = {
+        order.id for order in orders_without_coords
+        if order.address and order.address not in coordinates
+    }
+
+    located_orders = [
+        order for order in orders
+        if all([order.latitude, order.longitude])
+    ]
+    if not located_orders:
+        return distances, failed_order_ids
+
+    ranked_restaurants = get_restaurant_index().nearest(
+        [(order.latitude, order.longitude) for order in located_orders],
+        [
+            {restaurant.id for restaurant in available_restaurants[order.id]}
+            for order in located_orders
+        ],
+        limit=limit,
+    )
+
+    for order, restaurants_distances in zip(located_orders, ranked_restaurants):
+        distances[order.id] = dict(restaurants_distances)
+
+    return distances, failed_order_ids
 
-        distance = RADIUS(order_coords, restaurant_coords).km
-        restaurants_distances[restaurant] = distance
 
-    restaurants_distances_ordered = dict(
-        sorted(restaurants_distances.items(), key=lambda x: x[1])
+def refresh_order_candidates(orders, geocoder=fetch_coordinates):
+    orders = list(orders)
+    if not orders:
+        return
+
+    order_ids = [order.id for order in orders]
+    available_restaurants = fetch_available_restaurants(order_ids)
+    distances, failed_order_ids = fetch_restaurants_distances(
+        orders,
+        available_restaurants,
+        geocoder=geocoder,
+        limit=ORDER_CANDIDATES_LIMIT,
+    )
+
+    candidates = []
+    for order in orders:
+        if distances[order.id]:
+            restaurants_distances = distances[order.id].items()
+        else:
+            restaurants_distances = [
+                (restaurant, None)
+                for restaurant in available_restaurants[order.id]
+            ]
+        candidates.extend(
+            OrderCandidate(
+                order=order,
+                restaurant=restaurant,
+                distance_km=distance,
+            )
+            for restaurant, distance in restaurants_distances
+        )
+    with transaction.atomic():
+        # заказ могут пересчитывать одновременно фоновая задача и дашборд:
+        # без блокировки второй DELETE не увидит незакоммиченных кандидатов
+        # первого, и его INSERT упадёт на unique (order, restaurant)
+        list(
+            Order.objects
+            .select_for_update()
+            .filter(id__in=order_ids)
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        OrderCandidate.objects.filter(order_id__in=order_ids).delete()
+        OrderCandidate.objects.bulk_create(candidates)
+        refreshed_at = timezone.now()
+        # заказы, на которых сломался геокодер, оставляем непересчитанными:
+        # дашборд и фоновая задача попробуют их снова
+        Order.objects.filter(id__in=order_ids).exclude(
+            id__in=failed_order_ids,
+        ).update(
+            candidates_refreshed_at=refreshed_at,
+            updated_at=refreshed_at,
+        )
+        Order.objects.filter(id__in=failed_order_ids).update(
+            updated_at=refreshed_at,
         )
 
-    return restaurants_distances_ordered
@@ -0,0 +1,95 @@
+import gzip
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSION_MIN_SIZE = 1024
+BROTLI_QUALITY = 5
+
+
+def dump_json(data, pretty=False):
+    if pretty:
+        return json.dumps(
+            data,
+            cls=DjangoJSONEncoder,
+            ensure_ascii=False,
+            indent=4,
+        ).encode()
+    if orjson:
+        return orjson.dumps(data, default=DjangoJSONEncoder().default)
+    return json.dumps(
+        data,
+        cls=DjangoJSONEncoder,
+        ensure_ascii=False,
+        separators=(',', ':'),
+    ).encode()
+
+
+def is_pretty(request):
+    return request.GET.get('pretty') == '1'
+
+
+def negotiate_encoding(request):
+    accepted_encodings = set()
+    for accepted in request.headers.get('Accept-Encoding', '').split(','):
+        encoding, *params = [part.strip() for part in accepted.split(';')]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        if quality > 0:
+            accepted_encodings.add(encoding.lower())
+
+    if brotli and 'br' in accepted_encodings:
+        return 'br'
+    if 'gzip' in accepted_encodings:
+        return 'gzip'
+    return None
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=BROTLI_QUALITY)
+    # mtime=0 делает результат детерминированным, иначе поплывёт ETag
+    return gzip.compress(content, mtime=0)
+
+
+def make_json_response(content, encoding=None, status=200):
+    response = HttpResponse(
+        content,
+        content_type='application/json',
+        status=status,
+    )
+    patch_vary_headers(response, ['Accept-Encoding'])
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
+
+
+def json_response(request, data, status=200):
+    content = dump_json(data, pretty=is_pretty(request))
+
+    encoding = None
+    if len(content) >= COMPRESSION_MIN_SIZE:
+        encoding = negotiate_encoding(request)
+    if encoding:
+        content = compress(content, encoding)
+
+    return make_json_response(content, encoding=encoding, status=status)
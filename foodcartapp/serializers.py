@@ -1,9 +1,49 @@
-from rest_framework.serializers import ModelSerializer
+from django.db import transaction
 
+from rest_framework.serializers import (
+    BooleanField,
+    CharField,
+    IntegerField,
+    ListField,
+    ModelSerializer,
+    PrimaryKeyRelatedField,
+    Serializer,
+    ValidationError,
+)
+
+from .catalog import PRODUCT_FIELDS
 from .models import Order, OrderItem, Product
+from .tasks import enqueue_new_orders
+
+
+class ProductField(PrimaryKeyRelatedField):
+    '''
+    Если в контексте сериализатора есть словарь products, продукт берётся
+    из него, а не запрашивается из базы отдельно для каждой позиции.
+    '''
+    default_error_messages = {
+        'does_not_exist': 'Товар с id {pk_value} не найден или снят с продажи.',
+    }
+
+    def to_internal_value(self, data):
+        products = self.context.get('products')
+        if products is None:
+            return super().to_internal_value(data)
+
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            product_id = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+        if product_id not in products:
+            self.fail('does_not_exist', pk_value=data)
+        return products[product_id]
 
 
 class OrderItemSerializer(ModelSerializer):
+    product = ProductField(queryset=Product.objects.all())
 
     class Meta:
         model = OrderItem
@@ -31,12 +71,49 @@ class OrderSerializer(ModelSerializer):
             'address'
         ]
 
+    def to_internal_value(self, data):
+        if 'products' not in self.context:
+            self.context['products'] = (
+                Product.objects
+                .available()
+                .in_bulk(collect_product_ids([data]))
+            )
+        return super().to_internal_value(data)
+
     def create(self, validated_data):
-        products_data = validated_data.pop('products')
-        order = super().create(validated_data)
+        order, = create_orders([validated_data])
+        return order
+
 
-        order_items = []
+def collect_product_ids(orders_data):
+    product_ids = set()
+    for order_data in orders_data:
+        if not isinstance(order_data, dict):
+            continue
+        products_data = order_data.get('products')
+        if not isinstance(products_data, list):
+            continue
         for product_data in products_data:
+            if not isinstance(product_data, dict):
+                continue
+            try:
+                product_ids.add(int(product_data.get('product')))
+            except (TypeError, ValueError):
+                continue
+    return product_ids
+
+
+def create_orders(orders_data):
+    orders_data = [dict(order_data) for order_data in orders_data]
+    products_data = [order_data.pop('products') for order_data in orders_data]
+
+    orders = Order.objects.bulk_create(
+        [Order(**order_data) for order_data in orders_data]
+    )
+
+    order_items = []
+    for order, order_products_data in zip(orders, products_data):
+        for product_data in order_products_data:
             product = product_data['product']
             product_quantity = product_data['quantity']
             order_items.append(
@@ -47,5 +124,37 @@ class OrderSerializer(ModelSerializer):
                     order=order,
                 )
             )
-        OrderItem.objects.bulk_create(order_items)
-        return order
+    OrderItem.objects.bulk_create(order_items)
+
+    transaction.on_commit(lambda: enqueue_new_orders(orders))
+    return orders
+
+
+class ProductListQuerySerializer(Serializer):
+    fields = CharField(required=False)
+    category = IntegerField(required=False)
+    cursor = IntegerField(required=False, min_value=0)
+    limit = IntegerField(required=False, min_value=1, max_value=500)
+
+    def validate_fields(self, value):
+        fields = [field.strip() for field in value.split(',') if field.strip()]
+        unknown_fields = set(fields) - PRODUCT_FIELDS.keys()
+        if unknown_fields:
+            raise ValidationError(
+                f'Неизвестные поля: {", ".join(sorted(unknown_fields))}'
+            )
+        return fields or list(PRODUCT_FIELDS)
+
+
+class MenuItemReferenceSerializer(Serializer):
+    restaurant = IntegerField()
+    product = IntegerField()
+
+
+class MenuAvailabilitySerializer(Serializer):
+    availability = BooleanField()
+    items = ListField(
+        child=MenuItemReferenceSerializer(),
+        allow_empty=False,
+        max_length=10000,
+    )
@@ -0,0 +1,81 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version
+from .menu import invalidate_availability_matrix, menu_availability_changed
+from .models import (
+    Product,
+    ProductCategory,
+    Restaurant,
+    RestaurantMenuItem,
+)
+from .navigator import invalidate_restaurant_index
+from .tasks import schedule_candidates_refresh
+
+
+# матрица наличия должна сброситься раньше, чем пересчитаются кандидаты,
+# поэтому эти обработчики подключаются первыми
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def invalidate_availability_matrix_on_change(sender, **kwargs):
+    invalidate_availability_matrix()
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+def refresh_candidates_on_menu_item_save(sender, instance, **kwargs):
+    schedule_candidates_refresh(product_ids=[instance.product_id])
+
+
+@receiver(post_delete, sender=RestaurantMenuItem)
+def refresh_candidates_on_menu_item_delete(sender, instance, origin=None, **kwargs):
+    # кандидаты удаляемого ресторана удалятся каскадом вместе с ним
+    if isinstance(origin, Restaurant):
+        return
+    schedule_candidates_refresh(product_ids=[instance.product_id])
+
+
+@receiver(pre_save, sender=Restaurant)
+def remember_restaurant_coords(sender, instance, **kwargs):
+    if instance._state.adding:
+        return
+    instance.previous_coords = (
+        Restaurant.objects
+        .filter(pk=instance.pk)
+        .values_list('latitude', 'longitude')
+        .first()
+    )
+
+
+@receiver(post_save, sender=Restaurant)
+def refresh_candidates_on_restaurant_save(sender, instance, created, **kwargs):
+    invalidate_restaurant_index()
+    if created:
+        return
+    if instance.previous_coords == (instance.latitude, instance.longitude):
+        return
+    # ресторан мог войти в число ближайших у любого открытого заказа
+    schedule_candidates_refresh(all_open_orders=True)
+
+
+@receiver(post_delete, sender=Restaurant)
+def invalidate_index_on_restaurant_delete(sender, **kwargs):
+    invalidate_restaurant_index()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def bump_catalog_version_on_change(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(menu_availability_changed)
+def refresh_on_bulk_menu_change(sender, product_ids, **kwargs):
+    invalidate_availability_matrix()
+    bump_catalog_version()
+    schedule_candidates_refresh(product_ids=product_ids)
@@ -0,0 +1,86 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .models import Order
+from .navigator import refresh_order_candidates
+
+
+ORDER_PIPELINE_ASYNC = settings.ORDER_PIPELINE_ASYNC
+
+# Новые заказы обрабатываются в фоновом потоке того же процесса, брокер не
+# нужен. Если процесс упадёт раньше, чем обработает заказ, страница заказов
+# досчитает его сама — у такого заказа пустое поле candidates_refreshed_at.
+executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='order-pipeline')
+
+# изменения меню и ресторанов, накопленные в текущей транзакции потока
+pending_refresh = threading.local()
+
+
+def process_new_orders(order_ids):
+    refresh_order_candidates(Order.objects.filter(id__in=order_ids))
+
+
+def refresh_changed_orders(product_ids, all_open_orders):
+    orders = Order.objects.open()
+    if not all_open_orders:
+        orders = orders.filter(items__product_id__in=product_ids).distinct()
+    refresh_order_candidates(orders)
+
+
+def run_in_background(task, *args):
+    try:
+        task(*args)
+    except Exception:
+        logging.exception('Фоновая задача %s упала, аргументы: %s', task.__name__, args)
+    finally:
+        connections.close_all()
+
+
+def run_task(task, *args):
+    if ORDER_PIPELINE_ASYNC:
+        executor.submit(run_in_background, task, *args)
+    else:
+        task(*args)
+
+
+def enqueue_new_orders(orders):
+    order_ids = [order.id for order in orders]
+    if not order_ids:
+        return
+    run_task(process_new_orders, order_ids)
+
+
+def schedule_candidates_refresh(product_ids=(), all_open_orders=False):
+    '''
+    Копит изменения до коммита транзакции, а затем пересчитывает кандидатов
+    одной фоновой задачей: сохранение ресторана с десятком позиций меню
+    в админке даёт один пересчёт, а не по пересчёту на каждую строку.
+    '''
+    batch = getattr(pending_refresh, 'batch', None)
+    if batch is None:
+        batch = pending_refresh.batch = {
+            'product_ids': set(),
+            'all_open_orders': False,
+        }
+    batch['product_ids'].update(product_ids)
+    batch['all_open_orders'] |= all_open_orders
+    # вне транзакции колбэк выполнится сразу; после отката накопленное
+    # уйдёт со следующим коммитом, это лишь лишний пересчёт
+    transaction.on_commit(flush_candidates_refresh)
+
+
+def flush_candidates_refresh():
+    batch = getattr(pending_refresh, 'batch', None)
+    if batch is None:
+        return
+    del pending_refresh.batch
+    if batch['product_ids'] or batch['all_open_orders']:
+        run_task(
+            refresh_changed_orders,
+            batch['product_ids'],
+            batch['all_open_orders'],
+        )
@@ -0,0 +1,299 @@
+import random
+from unittest import mock
+
+from django.contrib.auth.models import Permission, User
+from django.core.cache import cache
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase
+from geopy.distance import great_circle
+
+from .distances import RestaurantIndex
+from .geocoder import GeocoderError
+from .models import (
+    Order,
+    OrderItem,
+    Product,
+    ProductCategory,
+    Restaurant,
+    RestaurantMenuItem,
+)
+from .navigator import refresh_order_candidates
+from .serializers import OrderSerializer
+from .versioned_cache import VersionedProcessCache
+from .views import BulkOrdersThrottle
+
+
+class OrderSerializerQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = ProductCategory.objects.create(name='Бургеры')
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'Бургер {number}', category=category, price=100 + number)
+            for number in range(21)
+        ])
+        restaurant = Restaurant.objects.create(
+            name='Ресторан',
+            address='Москва, Тверская 1',
+        )
+        # последний товар есть в меню, но снят с продажи
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(
+                restaurant=restaurant,
+                product=product,
+                availability=product != cls.products[-1],
+            )
+            for product in cls.products
+        ])
+        cls.available_products = cls.products[:-1]
+        cls.unavailable_product = cls.products[-1]
+
+    def make_order(self, product_ids):
+        return {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79161234567',
+            'address': 'Москва, Арбат 1',
+            'products': [
+                {'product': product_id, 'quantity': 2}
+                for product_id in product_ids
+            ],
+        }
+
+    def assert_validated_in_one_query(self, lines_count):
+        products = self.available_products[:lines_count]
+        serializer = OrderSerializer(
+            data=self.make_order([product.id for product in products])
+        )
+
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid(), serializer.errors)
+
+        validated_products = [
+            item['product'] for item in serializer.validated_data['products']
+        ]
+        self.assertEqual(validated_products, products)
+
+    def test_one_line(self):
+        self.assert_validated_in_one_query(1)
+
+    def test_twenty_lines(self):
+        self.assert_validated_in_one_query(20)
+
+    def test_rejects_unknown_product(self):
+        unknown_product_id = max(product.id for product in self.products) + 1
+        serializer = OrderSerializer(data=self.make_order([
+            self.available_products[0].id,
+            unknown_product_id,
+        ]))
+
+        with self.assertNumQueries(1):
+            self.assertFalse(serializer.is_valid())
+        self.assertIn('products', serializer.errors)
+
+    def test_rejects_unavailable_product(self):
+        serializer = OrderSerializer(data=self.make_order([
+            self.unavailable_product.id,
+        ]))
+
+        with self.assertNumQueries(1):
+            self.assertFalse(serializer.is_valid())
+        self.assertIn('products', serializer.errors)
+
+
+class MenuChangeRefreshTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = ProductCategory.objects.create(name='Бургеры')
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'Бургер {number}', category=category, price=100)
+            for number in range(3)
+        ])
+        cls.restaurant = Restaurant.objects.create(
+            name='Ресторан',
+            address='Москва, Тверская 1',
+        )
+
+    @mock.patch('foodcartapp.tasks.ORDER_PIPELINE_ASYNC', False)
+    @mock.patch('foodcartapp.tasks.refresh_changed_orders')
+    def test_refreshes_once_after_commit(self, refresh_changed_orders):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                for product in self.products:
+                    RestaurantMenuItem.objects.create(
+                        restaurant=self.restaurant,
+                        product=product,
+                    )
+                # пока транзакция не закоммичена, пересчёта нет
+                refresh_changed_orders.assert_not_called()
+
+        refresh_changed_orders.assert_called_once_with(
+            {product.id for product in self.products},
+            False,
+        )
+
+
+class RegisterOrdersBulkAccessTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.partner = User.objects.create_user('partner')
+        cls.partner.user_permissions.add(
+            Permission.objects.get(codename='add_order')
+        )
+        cls.manager = User.objects.create_user('manager', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def post_orders(self):
+        return self.client.post('/api/orders/bulk/', [], content_type='application/json')
+
+    def test_rejects_anonymous(self):
+        self.assertEqual(self.post_orders().status_code, 403)
+
+    def test_rejects_manager_without_permission(self):
+        self.client.force_login(self.manager)
+        self.assertEqual(self.post_orders().status_code, 403)
+
+    @mock.patch.object(BulkOrdersThrottle, 'rate', '2/min')
+    def test_throttles_partner(self):
+        self.client.force_login(self.partner)
+        statuses = [self.post_orders().status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+
+
+class RefreshOrderCandidatesGeocoderTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = ProductCategory.objects.create(name='Бургеры')
+        cls.product = Product.objects.create(
+            name='Бургер',
+            category=category,
+            price=100,
+        )
+        cls.restaurant = Restaurant.objects.create(
+            name='Ресторан',
+            address='Москва, Тверская 1',
+            latitude=55.76,
+            longitude=37.61,
+        )
+        RestaurantMenuItem.objects.create(
+            restaurant=cls.restaurant,
+            product=cls.product,
+        )
+
+    def create_order(self, address):
+        order = Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79161234567',
+            address=address,
+        )
+        OrderItem.objects.create(
+            order=order,
+            product=self.product,
+            quantity=1,
+            item_price=self.product.price,
+        )
+        return order
+
+    def test_retries_order_after_geocoder_failure(self):
+        order = self.create_order('Москва, Сломанная 1')
+
+        def broken_geocoder(address):
+            raise GeocoderError('Геокодер не ответил')
+
+        refresh_order_candidates([order], geocoder=broken_geocoder)
+
+        order.refresh_from_db()
+        self.assertIsNone(order.candidates_refreshed_at)
+        self.assertEqual(
+            list(order.candidates.values_list('restaurant_id', 'distance_km')),
+            [(self.restaurant.id, None)],
+        )
+
+        refresh_order_candidates([order], geocoder=lambda address: (55.75, 37.59))
+
+        order.refresh_from_db()
+        self.assertIsNotNone(order.candidates_refreshed_at)
+        self.assertIsNotNone(order.candidates.get().distance_km)
+
+    def test_marks_not_found_order_as_refreshed(self):
+        order = self.create_order('Москва, Несуществующая 1')
+
+        refresh_order_candidates([order], geocoder=lambda address: None)
+
+        order.refresh_from_db()
+        self.assertIsNone(order.latitude)
+        self.assertIsNotNone(order.candidates_refreshed_at)
+
+
+class RestaurantIndexDistancesTest(SimpleTestCase):
+    def setUp(self):
+        generator = random.Random(1)
+        self.points = [
+            (generator.uniform(-89, 89), generator.uniform(-180, 180))
+            for _ in range(250)
+        ]
+        self.restaurants = [
+            Restaurant(id=number, latitude=latitude, longitude=longitude)
+            for number, (latitude, longitude) in enumerate(self.points[50:], 1)
+        ]
+        self.index = RestaurantIndex(self.restaurants)
+        self.orders_points = self.points[:50]
+        self.available_restaurant_ids = [
+            {restaurant.id for restaurant in self.restaurants}
+        ] * len(self.orders_points)
+
+    def assert_match_great_circle(self, found):
+        for point, restaurants_distances in zip(self.orders_points, found):
+            self.assertTrue(restaurants_distances)
+            for restaurant, distance_km in restaurants_distances:
+                expected_km = great_circle(
+                    point,
+                    (restaurant.latitude, restaurant.longitude),
+                ).km
+                self.assertAlmostEqual(distance_km, expected_km, delta=1e-6)
+
+    def test_nearest_matches_great_circle(self):
+        self.assert_match_great_circle(self.index.nearest(
+            self.orders_points,
+            self.available_restaurant_ids,
+        ))
+
+    def test_within_matches_great_circle(self):
+        self.assert_match_great_circle(self.index.within(
+            self.orders_points,
+            self.available_restaurant_ids,
+            radius_km=5000,
+        ))
+
+
+class VersionedProcessCacheTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.builds = 0
+
+        def build():
+            self.builds += 1
+            return self.builds
+
+        self.cache = VersionedProcessCache(
+            key='test_version',
+            max_age=60,
+            build=build,
+        )
+
+    def test_rebuilds_after_invalidation(self):
+        self.assertEqual(self.cache.get(), 1)
+        self.assertEqual(self.cache.get(), 1)
+        # другой процесс сменил версию в общем кэше
+        VersionedProcessCache('test_version', 60, build=None).invalidate()
+        self.assertEqual(self.cache.get(), 2)
+
+    def test_rebuilds_after_max_age(self):
+        with mock.patch('foodcartapp.versioned_cache.time.monotonic', return_value=0):
+            self.assertEqual(self.cache.get(), 1)
+        with mock.patch('foodcartapp.versioned_cache.time.monotonic', return_value=60):
+            self.assertEqual(self.cache.get(), 1)
+        with mock.patch('foodcartapp.versioned_cache.time.monotonic', return_value=61):
+            self.assertEqual(self.cache.get(), 2)
@@ -0,0 +1,41 @@
+import time
+from uuid import uuid4
+
+from django.core.cache import cache
+
+
+class VersionedProcessCache:
+    '''
+    Объект, который дорого строить, хранится в памяти процесса, а в общем
+    кэше Django лежит только номер его версии. invalidate() меняет номер,
+    и все процессы пересобирают объект при следующем обращении.
+
+    Без общего кэша (LocMemCache) процесс не узнает об изменениях, сделанных
+    в других процессах, поэтому объект в любом случае пересобирается,
+    если он старше max_age секунд.
+    '''
+    def __init__(self, key, max_age, build):
+        self.key = key
+        self.max_age = max_age
+        self.build = build
+        # (объект, версия, время сборки) — одним кортежем, чтобы потоки
+        # не увидели объект от одной версии с номером от другой
+        self.cached = None
+
+    def get(self):
+        version = cache.get_or_set(self.key, uuid4().hex, timeout=None)
+        if self.cached is not None:
+            value, cached_version, built_at = self.cached
+            is_fresh = (
+                cached_version == version
+                and time.monotonic() - built_at <= self.max_age
+            )
+            if is_fresh:
+                return value
+
+        value = self.build()
+        self.cached = (value, version, time.monotonic())
+        return value
+
+    def invalidate(self):
+        cache.set(self.key, uuid4().hex, timeout=None)
@@ -1,16 +1,65 @@
-from django.db import transaction
-from django.http import JsonResponse
+import json
+from collections import defaultdict
+from datetime import timedelta
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
 from django.templatetags.static import static
+from django.views.decorators.http import condition
 
-from rest_framework.decorators import api_view
+from rest_framework import status
+from rest_framework.decorators import (
+    api_view,
+    permission_classes,
+    throttle_classes,
+)
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import BasePermission, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.throttling import UserRateThrottle
+
+from .catalog import PRODUCT_FIELDS, fetch_products, get_catalog
+from .menu import select_menu_items, set_menu_availability
+from .models import IdempotencyKey, Product, Order, OrderItem
+from .responses import (
+    is_pretty,
+    json_response,
+    make_json_response,
+    negotiate_encoding,
+)
+from .serializers import (
+    MenuAvailabilitySerializer,
+    OrderSerializer,
+    ProductListQuerySerializer,
+    collect_product_ids,
+    create_orders,
+)
+
+
+BULK_ORDERS_LIMIT = 1000
+IDEMPOTENCY_KEY_TTL = settings.IDEMPOTENCY_KEY_TTL
+PRODUCTS_PAGE_SIZE = 100
+PRODUCT_LIST_QUERY_PARAMS = {'fields', 'category', 'cursor', 'limit'}
+
+
+class CanAddOrders(BasePermission):
+    '''
+    Пакетная загрузка для агрегаторов: учётной записи партнёра выдаётся
+    только право на добавление заказов, без доступа к админке и дашборду.
+    '''
+    def has_permission(self, request, view):
+        return request.user.has_perm('foodcartapp.add_order')
 
-from .models import Product, Order, OrderItem
-from .serializers import OrderSerializer
+
+class BulkOrdersThrottle(UserRateThrottle):
+    scope = 'bulk_orders'
+    rate = settings.BULK_ORDERS_THROTTLE_RATE
 
 
 def banners_list_api(request):
-    return JsonResponse([
+    return json_response(request, [
         {
             'title': 'Burger',
             'src': static('burger.jpg'),
@@ -26,47 +75,183 @@ def banners_list_api(request):
             'src': static('tasty.jpg'),
             'text': 'Food is incomplete without a tasty dessert',
         }
-    ], safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
-    })
+    ])
+
+
+def get_requested_catalog(request):
+    return get_catalog(
+        pretty=is_pretty(request),
+        encoding=negotiate_encoding(request),
+    )
+
+
+def is_catalog_query(request):
+    return bool(PRODUCT_LIST_QUERY_PARAMS & request.GET.keys())
 
 
+def get_catalog_etag(request):
+    if is_catalog_query(request):
+        return None
+    return get_requested_catalog(request)['etag']
+
+
+@condition(etag_func=get_catalog_etag)
 def product_list_api(request):
-    products = Product.objects.select_related('category').available()
-
-    dumped_products = []
-    for product in products:
-        dumped_product = {
-            'id': product.id,
-            'name': product.name,
-            'price': product.price,
-            'special_status': product.special_status,
-            'description': product.description,
-            'category': {
-                'id': product.category.id,
-                'name': product.category.name,
-            } if product.category else None,
-            'image': product.image.url,
-            'restaurant': {
-                'id': product.id,
-                'name': product.name,
-            }
-        }
-        dumped_products.append(dumped_product)
-    return JsonResponse(dumped_products, safe=False, json_dumps_params={
-        'ensure_ascii': False,
-        'indent': 4,
+    if is_catalog_query(request):
+        return query_product_list(request)
+
+    catalog = get_requested_catalog(request)
+    return make_json_response(catalog['content'], encoding=catalog['encoding'])
+
+
+def query_product_list(request):
+    query = ProductListQuerySerializer(data=request.GET)
+    if not query.is_valid():
+        return json_response(request, query.errors, status=400)
+    params = query.validated_data
+
+    fields = params.get('fields', list(PRODUCT_FIELDS))
+    if 'cursor' not in params and 'limit' not in params:
+        return json_response(request, fetch_products(
+            fields=fields,
+            category_id=params.get('category'),
+        ))
+
+    limit = params.get('limit', PRODUCTS_PAGE_SIZE)
+    products = fetch_products(
+        fields=list(dict.fromkeys(['id', *fields])),
+        category_id=params.get('category'),
+        after_id=params.get('cursor'),
+        limit=limit + 1,
+    )
+    next_cursor = products[limit - 1]['id'] if len(products) > limit else None
+    products = products[:limit]
+    if 'id' not in fields:
+        for product in products:
+            del product['id']
+
+    return json_response(request, {
+        'results': products,
+        'next_cursor': next_cursor,
     })
 
 
-@api_view(['POST'])
-def register_order(request):
+def hash_order_request(data):
+    return sha256(
+        json.dumps(data, sort_keys=True, cls=DjangoJSONEncoder).encode()
+    ).hexdigest()
 
+
+def create_order(request):
     serializer = OrderSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
     order = serializer.save()
+    return order, OrderSerializer(order).data
+
+
+def replay_order_response(idempotency_key, request_hash):
+    if idempotency_key.request_hash != request_hash:
+        return Response(
+            {'detail': 'Ключ Idempotency-Key уже использован с другим запросом'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(idempotency_key.response)
+
+
+@api_view(['POST'])
+def register_order(request):
+    key = request.headers.get('Idempotency-Key')
+    if not key:
+        order, order_data = create_order(request)
+        return Response(order_data)
+    if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+        raise ValidationError('Слишком длинный Idempotency-Key')
+
+    request_hash = hash_order_request(request.data)
+    ttl = timedelta(seconds=IDEMPOTENCY_KEY_TTL)
+    IdempotencyKey.objects.filter(key=key).expired(ttl).delete()
+    if idempotency_key := IdempotencyKey.objects.filter(key=key).first():
+        return replay_order_response(idempotency_key, request_hash)
+
+    try:
+        with transaction.atomic():
+            order, order_data = create_order(request)
+            IdempotencyKey.objects.create(
+                key=key,
+                request_hash=request_hash,
+                order=order,
+                response=order_data,
+            )
+    except IntegrityError:
+        # параллельный повтор того же запроса успел сохранить заказ раньше;
+        # если ключа нет, нарушено другое ограничение — это не повтор
+        idempotency_key = IdempotencyKey.objects.filter(key=key).first()
+        if idempotency_key is None:
+            raise
+        return replay_order_response(idempotency_key, request_hash)
+
+    return Response(order_data)
+
+
+@api_view(['POST'])
+@permission_classes([CanAddOrders])
+@throttle_classes([BulkOrdersThrottle])
+def register_orders_bulk(request):
+    orders_data = request.data
+    if not isinstance(orders_data, list):
+        raise ValidationError('Ожидается список заказов')
+    if len(orders_data) > BULK_ORDERS_LIMIT:
+        raise ValidationError(
+            f'За один запрос можно передать не больше {BULK_ORDERS_LIMIT} заказов'
+        )
+
+    products = (
+        Product.objects
+        .available()
+        .in_bulk(collect_product_ids(orders_data))
+    )
+
+    results = []
+    valid_orders_data = []
+    for index, order_data in enumerate(orders_data):
+        serializer = OrderSerializer(
+            data=order_data,
+            context={'products': products},
+        )
+        if serializer.is_valid():
+            valid_orders_data.append(serializer.validated_data)
+            results.append({'index': index, 'status': 'created'})
+        else:
+            results.append({
+                'index': index,
+                'status': 'rejected',
+                'errors': serializer.errors,
+            })
+
+    with transaction.atomic():
+        orders = create_orders(valid_orders_data)
+
+    created_results = (
+        result for result in results if result['status'] == 'created'
+    )
+    for result, order in zip(created_results, orders):
+        result['id'] = order.id
+
+    return Response(results)
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def update_menu_availability(request):
+    serializer = MenuAvailabilitySerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
 
-    serializer = OrderSerializer(order)
+    restaurant_products = defaultdict(list)
+    for item in serializer.validated_data['items']:
+        restaurant_products[item['restaurant']].append(item['product'])
 
-    return Response(serializer.data)
+    updated_count = set_menu_availability(
+        select_menu_items(restaurant_products),
+        serializer.validated_data['availability'],
+    )
+    return Response({'updated': updated_count})
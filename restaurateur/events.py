@@ -0,0 +1,167 @@
+import json
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.utils import timezone
+
+from foodcartapp.models import Order
+from foodcartapp.navigator import ORDER_CANDIDATES_LIMIT
+from .orders import ORDERS_SYNC_OVERLAP, prefetch_candidates, serialize_order
+
+
+ORDER_EVENTS_POLL_INTERVAL = settings.ORDER_EVENTS_POLL_INTERVAL
+ORDER_EVENTS_QUEUE_SIZE = 1000
+
+
+def fetch_changed_orders(since):
+    orders = list(
+        Order.objects
+        .with_total()
+        .with_items()
+        .filter(updated_at__gte=since)
+        .order_by('updated_at', 'id')
+    )
+    prefetch_candidates(orders)
+    return orders
+
+
+def make_event(event_type, order, event_id):
+    return {
+        'id': event_id,
+        'type': event_type,
+        'order': serialize_order(order, ORDER_CANDIDATES_LIMIT),
+    }
+
+
+def format_event(event):
+    data = json.dumps(event['order'], cls=DjangoJSONEncoder, ensure_ascii=False)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+class Subscription:
+    def __init__(self):
+        self.events = queue.Queue(maxsize=ORDER_EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            # клиент не успевает читать: пусть переподключится
+            # с Last-Event-ID и доберёт пропущенное из базы
+            self.overflowed = True
+
+
+class OrderEventsHub:
+    '''
+    Один поток на процесс опрашивает заказы по updated_at и раздаёт
+    события всем подписчикам, поэтому нагрузка на базу не зависит от
+    числа открытых дашбордов. Поток живёт, пока есть хоть один подписчик.
+    '''
+    def __init__(self, poll_interval):
+        self.poll_interval = poll_interval
+        self.subscriptions = set()
+        self.statuses = {}
+        self.last_seen = {}
+        self.cursor = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        subscription = Subscription()
+        with self._lock:
+            self.subscriptions.add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self.subscriptions.discard(subscription)
+
+    def run(self):
+        try:
+            self.start()
+            while True:
+                with self._lock:
+                    if not self.subscriptions:
+                        self._thread = None
+                        return
+                    subscriptions = list(self.subscriptions)
+                try:
+                    events = self.poll()
+                except Exception:
+                    logging.exception('Не удалось получить изменения заказов')
+                    events = []
+                for subscription in subscriptions:
+                    for event in events:
+                        subscription.put(event)
+                time.sleep(self.poll_interval)
+        finally:
+            with self._lock:
+                if self._thread is threading.current_thread():
+                    self._thread = None
+            connections.close_all()
+
+    def start(self):
+        self.cursor = timezone.now()
+        self.statuses = dict(Order.objects.open().values_list('id', 'status'))
+        # заказы из окна перекрытия уже известны, о них не сообщаем
+        self.last_seen = dict(
+            Order.objects
+            .filter(updated_at__gte=self.cursor - ORDERS_SYNC_OVERLAP)
+            .values_list('id', 'updated_at')
+        )
+
+    def poll(self):
+        synced_at = timezone.now()
+        event_id = synced_at.isoformat()
+        events = []
+        last_seen = {}
+        # опрашиваем с запасом, чтобы не пропустить заказы из транзакций,
+        # закоммиченных после прошлого опроса; повторы отсекаем по updated_at
+        for order in fetch_changed_orders(self.cursor - ORDERS_SYNC_OVERLAP):
+            last_seen[order.id] = order.updated_at
+            if self.last_seen.get(order.id) == order.updated_at:
+                continue
+
+            previous_status = self.statuses.get(order.id)
+            if previous_status is None:
+                if order.status == 'completed':
+                    continue
+                events.append(make_event('order_created', order, event_id))
+            elif previous_status != order.status:
+                events.append(make_event('order_status_changed', order, event_id))
+            else:
+                events.append(make_event('order_updated', order, event_id))
+
+            if order.status == 'completed':
+                self.statuses.pop(order.id, None)
+            else:
+                self.statuses[order.id] = order.status
+
+        self.cursor = synced_at
+        self.last_seen = last_seen
+        return events
+
+
+order_events = OrderEventsHub(poll_interval=ORDER_EVENTS_POLL_INTERVAL)
+
+
+def catch_up_events(since):
+    '''
+    События для переподключившегося клиента. Прежний статус заказа
+    неизвестен, поэтому изменения отдаются как order_updated.
+    '''
+    event_id = timezone.now().isoformat()
+    for order in fetch_changed_orders(since - ORDERS_SYNC_OVERLAP):
+        if order.registered_at >= since:
+            yield make_event('order_created', order, event_id)
+        else:
+            yield make_event('order_updated', order, event_id)
@@ -0,0 +1,65 @@
+from datetime import timedelta
+
+from django.db.models import Prefetch, prefetch_related_objects
+
+from foodcartapp.models import OrderCandidate
+from foodcartapp.navigator import refresh_order_candidates
+
+
+# updated_at ставится при сохранении, а видна запись становится только
+# после коммита транзакции. Чтобы не потерять заказ из долгой транзакции,
+# изменения запрашиваются с запасом, а повторы отсекаются по id и updated_at
+ORDERS_SYNC_OVERLAP = timedelta(seconds=30)
+
+
+def prefetch_candidates(orders):
+    prefetch_related_objects(
+        orders,
+        Prefetch(
+            'candidates',
+            queryset=OrderCandidate.objects.select_related('restaurant'),
+        ),
+    )
+
+
+def fetch_orders_page(orders):
+    orders = list(orders)
+    refresh_order_candidates(
+        [order for order in orders if order.candidates_refreshed_at is None]
+    )
+    prefetch_candidates(orders)
+    return orders
+
+
+def serialize_order(order, candidates_limit):
+    return {
+        'id': order.id,
+        'status': order.status,
+        'payment_method': order.payment_method,
+        'firstname': order.firstname,
+        'lastname': order.lastname,
+        'phonenumber': str(order.phonenumber),
+        'address': order.address,
+        'comment': order.comment,
+        'registered_at': order.registered_at,
+        'updated_at': order.updated_at,
+        'restaurant': order.restaurant_id,
+        'total': order.total,
+        'items': [
+            {
+                'product': item.product_id,
+                'name': item.product.name,
+                'quantity': item.quantity,
+                'price': item.item_price,
+            }
+            for item in order.items.all()
+        ],
+        'candidates': [
+            {
+                'restaurant': candidate.restaurant_id,
+                'name': candidate.restaurant.name,
+                'distance_km': candidate.distance_km,
+            }
+            for candidate in order.candidates.all()[:candidates_limit]
+        ],
+    }
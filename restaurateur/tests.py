@@ -0,0 +1,200 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .events import OrderEventsHub
+
+from foodcartapp.menu import AvailabilityMatrix
+
+from foodcartapp.models import (
+    Order,
+    OrderCandidate,
+    OrderItem,
+    Product,
+    ProductCategory,
+    Restaurant,
+    RestaurantMenuItem,
+)
+
+
+class ViewOrdersQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', is_staff=True)
+        category = ProductCategory.objects.create(name='Бургеры')
+        cls.products = Product.objects.bulk_create([
+            Product(name=f'Бургер {number}', category=category, price=100 + number)
+            for number in range(3)
+        ])
+        cls.restaurants = Restaurant.objects.bulk_create([
+            Restaurant(
+                name=f'Ресторан {number}',
+                address=f'Москва, Тверская {number}',
+                latitude=55.75 + number / 100,
+                longitude=37.61,
+            )
+            for number in range(3)
+        ])
+
+    def create_orders(self, count):
+        orders = Order.objects.bulk_create([
+            Order(
+                firstname='Иван',
+                lastname='Петров',
+                phonenumber='+79161234567',
+                address=f'Москва, Арбат {number}',
+                latitude=55.75,
+                longitude=37.59,
+                candidates_refreshed_at=timezone.now(),
+            )
+            for number in range(count)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product=product,
+                quantity=2,
+                item_price=product.price,
+            )
+            for order in orders
+            for product in self.products[:2]
+        ])
+        OrderCandidate.objects.bulk_create([
+            OrderCandidate(order=order, restaurant=restaurant, distance_km=1.5)
+            for order in orders
+            for restaurant in self.restaurants[:2]
+        ])
+
+    def assert_orders_page_queries(self, orders_count):
+        self.create_orders(orders_count)
+        self.client.force_login(self.manager)
+
+        # все заказы на одной странице, чтобы N+1 был виден
+        with mock.patch('restaurateur.views.ORDERS_PAGE_SIZE', orders_count):
+            # сессия, пользователь, заказы с суммой и выбранным рестораном,
+            # кандидаты с ресторанами
+            with self.assertNumQueries(4):
+                response = self.client.get(reverse('restaurateur:view_orders'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['orders']), orders_count)
+        order = response.context['orders'][0]
+        self.assertEqual(order.total, Decimal('402.00'))
+
+    def test_one_order(self):
+        self.assert_orders_page_queries(1)
+
+    def test_hundred_orders(self):
+        self.assert_orders_page_queries(100)
+
+    def test_thousand_orders(self):
+        self.assert_orders_page_queries(1000)
+
+
+class OrdersApiSinceTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', is_staff=True)
+        cls.order = Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79161234567',
+            address='Москва, Арбат 1',
+            candidates_refreshed_at=timezone.now(),
+        )
+
+    def test_returns_order_committed_after_previous_poll(self):
+        self.client.force_login(self.manager)
+        response = self.client.get(reverse('restaurateur:orders_api'))
+        synced_at = response.json()['synced_at']
+
+        # заказ сохранили в транзакции до прошлого опроса,
+        # а закоммитили уже после него
+        Order.objects.filter(id=self.order.id).update(
+            status='en-route',
+            updated_at=timezone.now() - timedelta(seconds=5),
+        )
+
+        response = self.client.get(
+            reverse('restaurateur:orders_api'),
+            {'since': synced_at},
+        )
+        self.assertEqual(
+            [(order['id'], order['status']) for order in response.json()['results']],
+            [(self.order.id, 'en-route')],
+        )
+
+
+class OrderEventsHubTest(TestCase):
+    def create_order(self):
+        return Order.objects.create(
+            firstname='Иван',
+            lastname='Петров',
+            phonenumber='+79161234567',
+            address='Москва, Арбат 1',
+            candidates_refreshed_at=timezone.now(),
+        )
+
+    def poll_events(self, hub):
+        return [(event['type'], event['order']['id']) for event in hub.poll()]
+
+    def test_reports_order_committed_after_previous_poll(self):
+        order = self.create_order()
+        hub = OrderEventsHub(poll_interval=0)
+        hub.start()
+        self.assertEqual(self.poll_events(hub), [])
+
+        Order.objects.filter(id=order.id).update(
+            status='en-route',
+            updated_at=hub.cursor - timedelta(seconds=5),
+        )
+        self.assertEqual(
+            self.poll_events(hub),
+            [('order_status_changed', order.id)],
+        )
+        # повторный опрос того же окна событие не дублирует
+        self.assertEqual(self.poll_events(hub), [])
+
+    def test_reports_created_order(self):
+        hub = OrderEventsHub(poll_interval=0)
+        hub.start()
+        order = self.create_order()
+        self.assertEqual(self.poll_events(hub), [('order_created', order.id)])
+
+
+class ViewProductsStaleMatrixTest(TestCase):
+    def test_columns_match_header_after_restaurant_deleted(self):
+        manager = User.objects.create_user('manager', is_staff=True)
+        category = ProductCategory.objects.create(name='Бургеры')
+        product = Product.objects.create(
+            name='Бургер',
+            category=category,
+            price=100,
+            image='burger.png',
+        )
+        first, deleted, last = [
+            Restaurant.objects.create(name=name, address='Москва')
+            for name in ('А', 'Б', 'В')
+        ]
+        RestaurantMenuItem.objects.create(restaurant=last, product=product)
+        # матрица собрана до того, как другой процесс удалил ресторан
+        stale_matrix = AvailabilityMatrix.build()
+        deleted.delete()
+
+        self.client.force_login(manager)
+        with mock.patch(
+            'restaurateur.views.get_availability_matrix',
+            return_value=stale_matrix,
+        ):
+            response = self.client.get(reverse('restaurateur:ProductsView'))
+
+        self.assertEqual(response.context['restaurants'], [first, last])
+        self.assertEqual(
+            response.context['products_with_restaurant_availability'],
+            [(product, [False, True])],
+        )
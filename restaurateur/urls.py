@@ -15,6 +15,11 @@ urlpatterns = [
     # TODO заглушка для нереализованного функционала
     path('orders/', views.view_orders, name="view_orders"),
 
+    path('api/orders/', views.orders_api, name="orders_api"),
+    path('api/orders/events/', views.order_events_api, name="order_events_api"),
+
+    path('metrics/geocoder/', views.view_geocoder_metrics, name="geocoder_metrics"),
+
     path('login/', views.LoginView.as_view(), name="login"),
     path('logout/', views.LogoutView.as_view(), name="logout"),
 ]
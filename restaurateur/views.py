@@ -1,7 +1,13 @@
+import queue
+from urllib.parse import urlencode
+
 from django import forms
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
 from django.views import View
 from django.urls import reverse_lazy
+from django.utils import timezone
 from django.contrib.auth.decorators import user_passes_test
 
 from django.contrib.auth import authenticate, login
@@ -13,10 +19,19 @@ from foodcartapp.models import (
     Order,
 )
 
-from foodcartapp.navigator import (
-    fetch_available_restaurants,
-    fetch_restaurants_distances
-)
+from api_cache.cache import geocode_cache
+from foodcartapp.geocoder import geocoder_breaker
+from foodcartapp.menu import get_availability_matrix
+from foodcartapp.navigator import ORDER_CANDIDATES_LIMIT, geocode_flights
+from .events import catch_up_events, format_event, order_events
+from .orders import ORDERS_SYNC_OVERLAP, fetch_orders_page, serialize_order
+
+
+ORDERS_PAGE_SIZE = 50
+ORDERS_API_MAX_PAGE_SIZE = 500
+ROWS_PLACEHOLDER = '<!--rows-->'
+ORDER_EVENTS_HEARTBEAT_INTERVAL = 15
+ORDER_EVENTS_RETRY_MS = 3000
 
 
 class Login(forms.Form):
@@ -36,6 +51,43 @@ class Login(forms.Form):
     )
 
 
+class OrdersFilter(forms.Form):
+    status = forms.ChoiceField(
+        label='Статус', required=False,
+        choices=[('', 'Все незавершённые'), *Order.STATUS_CHOICES],
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    registered_from = forms.DateField(
+        label='С', required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    registered_to = forms.DateField(
+        label='По', required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    after = forms.IntegerField(required=False, widget=forms.HiddenInput)
+    before = forms.IntegerField(required=False, widget=forms.HiddenInput)
+
+
+class OrdersQuery(forms.Form):
+    since = forms.DateTimeField(required=False)
+    after = forms.IntegerField(required=False, min_value=0)
+    limit = forms.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=ORDERS_API_MAX_PAGE_SIZE,
+    )
+    candidates = forms.IntegerField(
+        required=False,
+        min_value=0,
+        max_value=ORDER_CANDIDATES_LIMIT,
+    )
+
+
+class OrderEventsQuery(forms.Form):
+    since = forms.DateTimeField(required=False)
+
+
 class LoginView(View):
     def get(self, request, *args, **kwargs):
         form = Login()
@@ -73,17 +125,28 @@ def is_manager(user):
 
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_products(request):
-    restaurants = list(Restaurant.objects.order_by('name'))
-    products = list(Product.objects.prefetch_related('menu_items'))
+    availability_matrix = get_availability_matrix()
+    restaurants = Restaurant.objects.in_bulk(availability_matrix.restaurant_ids)
+    restaurants = [
+        restaurants[restaurant_id]
+        for restaurant_id in availability_matrix.restaurant_ids
+        if restaurant_id in restaurants
+    ]
+    products = list(Product.objects.select_related('category'))
 
-    products_with_restaurant_availability = []
-    for product in products:
-        availability = {item.restaurant_id: item.availability for item in product.menu_items.all()}
-        ordered_availability = [availability.get(restaurant.id, False) for restaurant in restaurants]
-
-        products_with_restaurant_availability.append(
-            (product, ordered_availability)
+    # рестораны, удалённые после сборки матрицы, выпали из шапки,
+    # поэтому и флаги берём только для оставшихся, чтобы колонки не съехали
+    restaurant_ids = [restaurant.id for restaurant in restaurants]
+    products_with_restaurant_availability = [
+        (
+            product,
+            availability_matrix.get_product_availability(
+                product.id,
+                restaurant_ids,
+            ),
         )
+        for product in products
+    ]
 
     return render(request, template_name="products_list.html", context={
         'products_with_restaurant_availability': products_with_restaurant_availability,
@@ -98,19 +161,174 @@ def view_restaurants(request):
     })
 
 
+def stream_orders(request, orders, context):
+    page_head, page_tail = render_to_string(
+        'order_items.html',
+        context={**context, 'streaming': True},
+        request=request,
+    ).split(ROWS_PLACEHOLDER)
+    yield page_head
+
+    last_order_id = 0
+    while True:
+        orders_page = fetch_orders_page(
+            orders.filter(id__gt=last_order_id).order_by('id')[:ORDERS_PAGE_SIZE]
+        )
+        if not orders_page:
+            break
+        for order in orders_page:
+            yield render_to_string(
+                'order_row.html',
+                context={'item': order},
+                request=request,
+            )
+        last_order_id = orders_page[-1].id
+
+    yield page_tail
+
+
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_orders(request):
-    orders = Order.objects.exclude(status='completed')
-
-    distances = {}
-    for order in orders:
-        restaurants_with_all_order_products = fetch_available_restaurants(order.id)
-        distances[order.id] = fetch_restaurants_distances(
-            restaurants_with_all_order_products,
-            order
+    filter_form = OrdersFilter(request.GET)
+    filter_form.is_valid()
+    filters = filter_form.cleaned_data
+
+    orders = Order.objects.with_total().select_related('restaurant')
+    if filters.get('status'):
+        orders = orders.filter(status=filters['status'])
+    else:
+        orders = orders.open()
+    if filters.get('registered_from'):
+        orders = orders.filter(registered_at__date__gte=filters['registered_from'])
+    if filters.get('registered_to'):
+        orders = orders.filter(registered_at__date__lte=filters['registered_to'])
+
+    context = {'filter_form': filter_form}
+
+    if request.GET.get('stream'):
+        return StreamingHttpResponse(stream_orders(request, orders, context))
+
+    if filters.get('before'):
+        orders_page = orders.filter(id__lt=filters['before']).order_by('-id')
+    else:
+        orders_page = orders.filter(id__gt=filters.get('after') or 0).order_by('id')
+    orders_page = fetch_orders_page(orders_page[:ORDERS_PAGE_SIZE + 1])
+
+    has_more = len(orders_page) > ORDERS_PAGE_SIZE
+    orders_page = orders_page[:ORDERS_PAGE_SIZE]
+    if filters.get('before'):
+        orders_page.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, bool(filters.get('after'))
+
+    page_filters = {
+        name: value for name, value in request.GET.items()
+        if name not in ('after', 'before')
+    }
+    if orders_page and has_next:
+        context['next_page_url'] = '?' + urlencode(
+            {**page_filters, 'after': orders_page[-1].id}
+        )
+    if orders_page and has_previous:
+        context['previous_page_url'] = '?' + urlencode(
+            {**page_filters, 'before': orders_page[0].id}
         )
 
     return render(request, template_name='order_items.html', context={
-        'orders': orders,
-        'distances': distances,
+        **context,
+        'orders': orders_page,
+    })
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def orders_api(request):
+    '''
+    Открытые заказы с суммой, составом и ближайшими ресторанами.
+    С параметром since отдаёт все заказы, изменённые с этого момента,
+    включая выполненные, чтобы дашборд мог убрать их у себя.
+    synced_at в ответе отстаёт от текущего времени на ORDERS_SYNC_OVERLAP,
+    поэтому заказ может прийти повторно: клиент сверяет id и updated_at.
+    '''
+    query = OrdersQuery(request.GET)
+    if not query.is_valid():
+        return JsonResponse(query.errors, status=400)
+    params = query.cleaned_data
+    limit = params['limit'] or ORDERS_PAGE_SIZE
+    candidates_limit = params['candidates']
+    if candidates_limit is None:
+        candidates_limit = ORDER_CANDIDATES_LIMIT
+
+    synced_at = timezone.now() - ORDERS_SYNC_OVERLAP
+    orders = Order.objects.with_total().with_items()
+    if params['since']:
+        orders = orders.filter(updated_at__gte=params['since'])
+    else:
+        orders = orders.open()
+    orders_page = fetch_orders_page(
+        orders.filter(id__gt=params['after'] or 0).order_by('id')[:limit + 1]
+    )
+
+    has_next = len(orders_page) > limit
+    orders_page = orders_page[:limit]
+    return JsonResponse({
+        'results': [
+            serialize_order(order, candidates_limit) for order in orders_page
+        ],
+        'next_cursor': orders_page[-1].id if has_next else None,
+        'synced_at': synced_at,
+    })
+
+
+def stream_order_events(since):
+    subscription = order_events.subscribe()
+    try:
+        yield f'retry: {ORDER_EVENTS_RETRY_MS}\n\n'
+        if since:
+            for event in catch_up_events(since):
+                yield format_event(event)
+
+        while not subscription.overflowed:
+            try:
+                event = subscription.events.get(
+                    timeout=ORDER_EVENTS_HEARTBEAT_INTERVAL,
+                )
+            except queue.Empty:
+                # комментарий не даёт прокси закрыть простаивающее соединение
+                yield ': heartbeat\n\n'
+                continue
+            yield format_event(event)
+    finally:
+        order_events.unsubscribe(subscription)
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def order_events_api(request):
+    '''
+    Server-Sent Events с изменениями заказов: order_created,
+    order_status_changed и order_updated. В данных — заказ в том же виде,
+    что и в orders_api, вместе с ближайшими ресторанами. Переподключившийся
+    клиент получает пропущенное по заголовку Last-Event-ID.
+    '''
+    query = OrderEventsQuery({
+        'since': request.headers.get('Last-Event-ID') or request.GET.get('since'),
+    })
+    if not query.is_valid():
+        return JsonResponse(query.errors, status=400)
+
+    response = StreamingHttpResponse(
+        stream_order_events(query.cleaned_data['since']),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_geocoder_metrics(request):
+    return JsonResponse({
+        'breaker': geocoder_breaker.stats(),
+        'cache': geocode_cache.stats(),
+        'single_flight': geocode_flights.stats(),
     })
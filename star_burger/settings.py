@@ -12,6 +12,24 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 YANDEX_MAPS_API_KEY = env.str('YANDEX_MAPS_API_KEY')
+GEOCODER_MAX_WORKERS = env.int('GEOCODER_MAX_WORKERS', 8)
+GEOCODER_CACHE_SIZE = env.int('GEOCODER_CACHE_SIZE', 4096)
+GEOCODER_CACHE_TTL = env.int('GEOCODER_CACHE_TTL', 30 * 24 * 60 * 60)
+GEOCODER_NEGATIVE_CACHE_TTL = env.int('GEOCODER_NEGATIVE_CACHE_TTL', 60 * 60)
+GEOCODER_BACKEND = env.str('GEOCODER_BACKEND', 'foodcartapp.geocoder.YandexGeocoder')
+GEOCODER_URL = env.str('GEOCODER_URL', 'https://geocode-maps.yandex.ru/1.x')
+GEOCODER_TIMEOUT = env.float('GEOCODER_TIMEOUT', 5)
+GEOCODER_CONNECT_TIMEOUT = env.float('GEOCODER_CONNECT_TIMEOUT', 3)
+GEOCODER_RETRIES = env.int('GEOCODER_RETRIES', 2)
+GEOCODER_BACKOFF_FACTOR = env.float('GEOCODER_BACKOFF_FACTOR', 0.5)
+GEOCODER_LOCK_TIMEOUT = env.int('GEOCODER_LOCK_TIMEOUT', 30)
+GEOCODER_BREAKER_THRESHOLD = env.int('GEOCODER_BREAKER_THRESHOLD', 5)
+GEOCODER_BREAKER_RESET_TIMEOUT = env.int('GEOCODER_BREAKER_RESET_TIMEOUT', 30)
+ORDER_CANDIDATES_LIMIT = env.int('ORDER_CANDIDATES_LIMIT', 5)
+ORDER_EVENTS_POLL_INTERVAL = env.float('ORDER_EVENTS_POLL_INTERVAL', 2)
+ORDER_PIPELINE_ASYNC = env.bool('ORDER_PIPELINE_ASYNC', True)
+IDEMPOTENCY_KEY_TTL = env.int('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+BULK_ORDERS_THROTTLE_RATE = env.str('BULK_ORDERS_THROTTLE_RATE', '10/min')
 SECRET_KEY = env.str('SECRET_KEY')
 DEBUG = env.bool('DEBUG', False)
 
@@ -89,6 +107,10 @@ DATABASES = {
     )
 }
 
+CACHES = {
+    'default': env.dj_cache_url('CACHE_URL', 'locmem://'),
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',